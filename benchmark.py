@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import logging
+import tempfile
+import argparse
+import platform
+import threading
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import psutil
+from lxml import html
+from selenium.webdriver.common.by import By
+import mock_scholar
+from fetch_engines import HttpEngine, SeleniumEngine, driver_block_reason
+from profile_lister import ProfileLister, ProfileBlocked, browse_profile
+from response_cache import ResponseCache
+from driver_pool import DriverPool, headless_options
+from bibtex import parse_bibtex
+
+# Offline benchmark of the fetch paths against mock_scholar: papers/s,
+# per-item latency and peak RSS for every workload x engine x concurrency
+# x cache state, written to a JSON report that later runs compare against.
+#   python benchmark.py --engine http --concurrency 1 4 16 --output before.json
+#   python benchmark.py --engine http --concurrency 1 4 16 --compare before.json
+
+WORKLOADS = ['details', 'profiles', 'citations']
+ENGINES = ['http', 'selenium']
+CACHE_STATES = ['none', 'cold', 'warm']  # no cache, empty cache, cache filled by an earlier pass
+REPORT_FILE = 'bench_report.json'
+TOLERANCE = 0.10  # slowdown (papers/s or p99) flagged as a regression when comparing reports
+
+Scenario = namedtuple('Scenario', ['workload', 'engine', 'concurrency', 'cache'])
+Outcome = namedtuple('Outcome', ['seconds', 'papers', 'status'])  # status: ok, blocked or error
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+class RssSampler:
+    # Peak resident memory of this process and its children (browsers and
+    # chromedriver included), sampled every `interval` seconds
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        total = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass  # exited between listing and reading
+        self.peak = max(self.peak, total)
+
+    def __enter__(self):
+        self.sample()
+
+        def run():
+            while not self.stop_event.wait(self.interval):
+                self.sample()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.sample()
+
+
+def run_items(items, work, workers):
+    # work(worker, item) -> (papers, status), on one of `workers` (engines,
+    # listers or browsers), each used by one item at a time; len(workers)
+    # items run at once
+    idle = queue.Queue()
+    for worker in workers:
+        idle.put(worker)
+
+    def one(item):
+        worker = idle.get()
+        start_time = time.perf_counter()
+        try:
+            papers, status = work(worker, item)
+        except ProfileBlocked as e:
+            papers, status = 0, 'error' if 'No publication table' in str(e) else 'blocked'
+        except Exception as e:
+            logging.debug(f"Benchmark item {item} failed: {e}")
+            papers, status = 0, 'error'
+        finally:
+            idle.put(worker)
+        return Outcome(time.perf_counter() - start_time, papers, status)
+
+    with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+        return list(executor.map(one, items))
+
+
+def detail_outcome(engine, details):
+    # (papers, status) of one citation page: a blocked or empty page is no paper
+    if engine.is_detected():
+        return 0, 'blocked'
+    return (1, 'ok') if any(value != 'N/A' for value in details.values()) else (0, 'error')
+
+
+def http_get(engine, cache, url):
+    # One page through the cache, the way the scrapers use it
+    body = cache.get(url) if cache else None
+    if body is not None:
+        return html.fromstring(body), None
+    tree = engine.load(url)
+    if cache and engine.status_code == 200 and not engine.blocked:
+        cache.put(url, engine.content)
+    return tree, engine.blocked or (None if engine.status_code == 200 else f'HTTP {engine.status_code}')
+
+
+def http_citation(engine, cache, url):
+    # Search result -> cite popup -> BibTeX, as bs4_udsm does in a browser
+    for step in ['search', 'cite', 'bibtex']:
+        tree, problem = http_get(engine, cache, url)
+        if problem:
+            return 0, 'error' if problem.startswith('HTTP 5') else 'blocked'
+        if step == 'search':
+            cid = tree.xpath('//div[@class="gs_ri"]//h3//a/@data-clk-atid')[0]
+            url = urljoin(url, f"/scholar?hl=en&q=info:{cid}:scholar.google.com/&output=cite&scirp=0")
+        elif step == 'cite':
+            url = urljoin(url, tree.xpath('//a[text()="BibTeX"]/@href')[0])
+    return (1, 'ok') if parse_bibtex(tree.text_content()) else (0, 'error')
+
+
+def browser_citation(driver, url):
+    for step in ['search', 'cite', 'bibtex']:
+        driver.get(url)
+        if driver_block_reason(driver):
+            return 0, 'blocked'
+        if step == 'search':
+            cid = driver.find_element(By.CSS_SELECTOR, "div.gs_ri h3 a").get_attribute("data-clk-atid")
+            url = urljoin(url, f"/scholar?hl=en&q=info:{cid}:scholar.google.com/&output=cite&scirp=0")
+        elif step == 'cite':
+            url = driver.find_element(By.LINK_TEXT, "BibTeX").get_attribute("href")
+    return (1, 'ok') if parse_bibtex(driver.find_element(By.TAG_NAME, "pre").text) else (0, 'error')
+
+
+def browser_profile(driver, url):
+    listing = browse_profile(driver, url)
+    if driver_block_reason(driver):
+        return 0, 'blocked'
+    return len(listing.rows), 'ok' if listing.rows else 'error'
+
+
+class Benchmark:
+    # One mock server for the whole run; every scenario gets a fresh cache
+    # in a temporary folder and its own engines or browsers
+    def __init__(self, papers=200, profiles=8, citations=30, latency=0.05, error_rate=0, captcha_rate=0,
+                 seed=0, browser_binary=None):
+        self.sizes = {'details': papers, 'profiles': profiles, 'citations': citations}
+        self.browser_binary = browser_binary
+        self.config = {'latency': latency, 'error_rate': error_rate, 'captcha_rate': captcha_rate, 'seed': seed,
+                       'papers': papers, 'profiles': profiles, 'citations': citations}
+        self.server = mock_scholar.start_server(latency=latency, error_rate=error_rate,
+                                                captcha_rate=captcha_rate, seed=seed)
+        self.folder = tempfile.mkdtemp(prefix='scholar_bench_')
+
+    def items(self, workload):
+        count = self.sizes[workload]
+        if workload == 'details':
+            # Distinct ids, each served one of the static citation fixtures
+            return [mock_scholar.citation_url(self.server, f'bench{index:05d}') for index in range(count)]
+        if workload == 'profiles':
+            return [f"{mock_scholar.profile_url(self.server)}&bench={index}" for index in range(count)]
+        titles = sorted(mock_scholar.cite_titles().values())
+        return [mock_scholar.search_url(self.server, titles[index % len(titles)], 2000 + index)
+                for index in range(count)]
+
+    def _http(self, workload, concurrency, cache):
+        if workload == 'details':
+            engines = [HttpEngine(cache=cache) for _ in range(concurrency)]
+            work = lambda engine, url: detail_outcome(engine, engine.scrape_paper_details(url))
+        elif workload == 'profiles':
+            engines = [ProfileLister(cache=cache) for _ in range(concurrency)]
+            work = lambda lister, url: (len(lister.list_profile(url).rows), 'ok')
+        else:
+            engines = [HttpEngine() for _ in range(concurrency)]
+            work = lambda engine, url: http_citation(engine, cache, url)
+        return engines, work, lambda: [engine.close() for engine in engines]
+
+    def _selenium(self, workload, concurrency, cache):
+        pool = DriverPool(size=concurrency, lean=True,
+                          options_factory=lambda: headless_options(binary_location=self.browser_binary))
+        pool.start()
+        if workload == 'details':
+            engines = [SeleniumEngine(cache=cache, driver_pool=pool) for _ in range(concurrency)]
+            work = lambda engine, url: detail_outcome(engine, engine.scrape_paper_details(url))
+        else:
+            # Browser pages never go through the cache on these paths
+            engines = [pool] * concurrency
+            browse = browser_profile if workload == 'profiles' else browser_citation
+            work = lambda pool, url: self._leased(pool, browse, url)
+        return engines, work, pool.stop
+
+    def _leased(self, pool, browse, url):
+        with pool.lease() as driver:
+            return browse(driver, url)
+
+    def run(self, scenario):
+        items = self.items(scenario.workload)
+        cache_path = os.path.join(self.folder, f"{'_'.join(map(str, scenario))}.sqlite")
+        cache = ResponseCache(cache_path) if scenario.cache != 'none' else None
+        setup = self._http if scenario.engine == 'http' else self._selenium
+        try:
+            workers, work, close = setup(scenario.workload, scenario.concurrency, cache)
+        except Exception as e:
+            if cache:
+                cache.close()
+            return dict(scenario._asdict(), skipped=f"{type(e).__name__}: {e}".splitlines()[0])
+        try:
+            if scenario.cache == 'warm':
+                run_items(items, work, workers)  # fills the cache, not measured
+            served_before = dict(self.server.counts)
+            with RssSampler() as rss:
+                start_time = time.perf_counter()
+                outcomes = run_items(items, work, workers)
+                seconds = time.perf_counter() - start_time
+        finally:
+            close()
+            if cache:
+                cache.close()
+        return self.report(scenario, outcomes, seconds, rss.peak, served_before)
+
+    def report(self, scenario, outcomes, seconds, peak_rss, served_before):
+        latencies = sorted(outcome.seconds for outcome in outcomes)
+        papers = sum(outcome.papers for outcome in outcomes)
+        statuses = [outcome.status for outcome in outcomes]
+        served = {kind: count - served_before.get(kind, 0) for kind, count in self.server.counts.items()}
+        return dict(scenario._asdict(),
+                    items=len(outcomes), papers=papers,
+                    ok=statuses.count('ok'), blocked=statuses.count('blocked'), errors=statuses.count('error'),
+                    seconds=round(seconds, 3),
+                    items_per_sec=round(len(outcomes) / seconds, 2) if seconds else 0.0,
+                    papers_per_sec=round(papers / seconds, 2) if seconds else 0.0,
+                    p50_ms=round(percentile(latencies, 0.5) * 1000, 1),
+                    p99_ms=round(percentile(latencies, 0.99) * 1000, 1),
+                    mean_ms=round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+                    peak_rss_mb=round(peak_rss / 1024 / 1024, 1),
+                    server=served)
+
+    def close(self):
+        self.server.shutdown()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'commit': commit or None, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def scenario_key(result):
+    return tuple(result[field] for field in Scenario._fields)
+
+
+def compare(previous, current, tolerance=TOLERANCE):
+    # Prints papers/s and p99 of every scenario both reports ran; returns
+    # the ones that got slower by more than `tolerance`. Reports run with
+    # different mock settings or sizes are not comparable: ValueError.
+    if previous.get('config') != current['config']:
+        old = previous.get('config') or {}
+        changed = sorted(key for key in set(old) | set(current['config'])
+                         if old.get(key) != current['config'].get(key))
+        raise ValueError(f"Reports ran with different settings: "
+                         + ', '.join(f"{key} {old.get(key)} -> {current['config'].get(key)}" for key in changed))
+    before = {scenario_key(result): result for result in previous['scenarios'] if 'skipped' not in result}
+    regressions = []
+    print(f"\n{'scenario':<34}{'papers/s':>19}{'change':>9}{'p99 ms':>21}{'change':>9}")
+    for result in current['scenarios']:
+        old = before.get(scenario_key(result))
+        if old is None or 'skipped' in result:
+            continue
+        speed = (result['papers_per_sec'] - old['papers_per_sec']) / old['papers_per_sec'] if old['papers_per_sec'] else 0.0
+        p99 = (result['p99_ms'] - old['p99_ms']) / old['p99_ms'] if old['p99_ms'] else 0.0
+        slower = speed < -tolerance or p99 > tolerance
+        if slower:
+            regressions.append(result)
+        name = '/'.join(map(str, scenario_key(result)))
+        print(f"{name:<34}{old['papers_per_sec']:>8} -> {result['papers_per_sec']:<7}{speed:>+9.0%}"
+              f"{old['p99_ms']:>9} -> {result['p99_ms']:<8}{p99:>+9.0%}{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def run_benchmark(scenarios, output_file=REPORT_FILE, **options):
+    bench = Benchmark(**options)
+    results = []
+    try:
+        for scenario in scenarios:
+            result = bench.run(scenario)
+            results.append(result)
+            name = '/'.join(map(str, scenario))
+            if 'skipped' in result:
+                print(f"{name:<34} skipped: {result['skipped']}")
+            else:
+                print(f"{name:<34} {result['papers_per_sec']:>8} papers/s  p50 {result['p50_ms']:>7} ms  "
+                      f"p99 {result['p99_ms']:>7} ms  {result['peak_rss_mb']:>6} MB  "
+                      f"({result['ok']} ok, {result['blocked']} blocked, {result['errors']} errors)")
+    finally:
+        bench.close()
+    report = {'environment': environment(), 'config': bench.config, 'scenarios': results}
+    with open(output_file + '.part', 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=1)
+    os.replace(output_file + '.part', output_file)
+    print(f"Report written to {output_file}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers offline against the mock Scholar server")
+    parser.add_argument('--workload', nargs='+', choices=WORKLOADS, default=WORKLOADS)
+    parser.add_argument('--engine', nargs='+', choices=ENGINES, default=ENGINES)
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--cache', nargs='+', choices=CACHE_STATES, default=CACHE_STATES)
+    parser.add_argument('--papers', type=int, default=200, help="citation pages per details scenario")
+    parser.add_argument('--profiles', type=int, default=8, help="profiles per profiles scenario")
+    parser.add_argument('--citations', type=int, default=30, help="BibTeX lookups per citations scenario")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds added to every mock response")
+    parser.add_argument('--error-rate', type=float, default=0, help="share of requests answered with a 503")
+    parser.add_argument('--captcha-rate', type=float, default=0, help="share of requests sent to the captcha page")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--browser-binary', default=None)
+    parser.add_argument('--output', default=REPORT_FILE)
+    parser.add_argument('--compare', metavar='REPORT', help="an earlier report to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    scenarios = [Scenario(workload, engine, concurrency, cache)
+                 for workload in args.workload for engine in args.engine
+                 for concurrency in args.concurrency for cache in args.cache
+                 if engine == 'http' or workload == 'details' or cache == 'none']
+    report = run_benchmark(scenarios, args.output, papers=args.papers, profiles=args.profiles,
+                           citations=args.citations, latency=args.latency, error_rate=args.error_rate,
+                           captcha_rate=args.captcha_rate, seed=args.seed, browser_binary=args.browser_binary)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            previous = json.load(file)
+        try:
+            regressions = compare(previous, report, args.tolerance)
+        except ValueError as e:
+            print(f"Not comparing with {args.compare}: {e}")
+            sys.exit(2)
+        if regressions:
+            print(f"{len(regressions)} scenarios slower than {args.compare} by more than {args.tolerance:.0%}")
+            sys.exit(1)
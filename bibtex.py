@@ -0,0 +1,240 @@
+import re
+import sys
+import logging
+from collections import namedtuple
+from result_schema import open_result_sink, typed_row
+
+BibEntry = namedtuple('BibEntry', ['type', 'key', 'fields'])
+
+
+class BibTeXError(ValueError):
+    pass
+
+
+# Macros every BibTeX style defines
+MONTHS = {
+    'jan': 'January', 'feb': 'February', 'mar': 'March', 'apr': 'April', 'may': 'May', 'jun': 'June',
+    'jul': 'July', 'aug': 'August', 'sep': 'September', 'oct': 'October', 'nov': 'November', 'dec': 'December',
+}
+
+ENTRY_START = re.compile(r'@\s*([A-Za-z]+)\s*([{(])')
+PARTIAL_START = re.compile(r'@\s*[A-Za-z]*\s*')
+DELIMITERS = re.compile(r'[{}()"]|\n[ \t]*@[A-Za-z]+[ \t]*[{(]')
+BRACES = re.compile(r'[{}]')
+SEPARATORS = re.compile(r'[\s,]*')
+FIELD_NAME = re.compile(r'\s*([^\s=,{}"#]+)\s*=\s*')
+WORD = re.compile(r'[^\s,#{}"]+')
+SPACE = re.compile(r'\s*')
+
+MAX_ENTRY_CHARS = 1 << 20  # an entry still open after this much text is treated as broken
+
+
+def _chunks(source, size=1 << 16):
+    if isinstance(source, str):
+        yield source
+        return
+    while True:
+        chunk = source.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _scan_block(text, start):
+    # text[start] is an '@'. Returns (type, body, end) for a complete
+    # '@type{...}' block, 'partial' if it needs more text, None if this '@'
+    # does not start an entry (e.g. an address in a comment) and 'broken'
+    # if another entry starts on a new line before this one closed.
+    match = ENTRY_START.match(text, start)
+    if match is None:
+        return 'partial' if PARTIAL_START.fullmatch(text, start) else None
+    closer = '}' if match.group(2) == '{' else ')'
+    depth = 0
+    quoted = False  # inside a "value" of a (...) entry, where ')' does not close
+    for delimiter in DELIMITERS.finditer(text, match.end()):
+        char = delimiter.group()
+        if len(char) > 1:
+            return 'broken'
+        if char == '"':
+            if depth == 0 and closer == ')':
+                quoted = not quoted
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            if depth == 0 and closer == '}':
+                return match.group(1).lower(), text[match.end():delimiter.start()], delimiter.end()
+            depth -= 1
+        elif char == ')' and depth == 0 and closer == ')' and not quoted:
+            return match.group(1).lower(), text[match.end():delimiter.start()], delimiter.end()
+    return 'partial'
+
+
+def _blocks(source):
+    # (type, body) for every block, holding at most one block in memory. An
+    # entry that never closes is skipped and scanning resumes right after its
+    # '@': as soon as the next entry starts on a new line, or else once
+    # MAX_ENTRY_CHARS have been read past it or the input ends
+    chunks = _chunks(source)
+    buffer = ''
+    finished = False
+    while not finished:
+        chunk = next(chunks, None)
+        if chunk is None:
+            finished = True
+        else:
+            buffer += chunk
+        position = 0
+        while True:
+            start = buffer.find('@', position)
+            if start == -1:
+                buffer = ''
+                break
+            block = _scan_block(buffer, start)
+            if block == 'broken' or (block == 'partial' and (finished or len(buffer) - start > MAX_ENTRY_CHARS)):
+                logging.warning(f"Skipping unterminated BibTeX entry: {buffer[start:start + 60]!r}")
+                position = start + 1
+                continue
+            if block == 'partial':
+                buffer = buffer[start:]
+                break
+            if block is None:
+                position = start + 1
+                continue
+            kind, body, position = block
+            yield kind, body
+
+
+def _matching_brace(text, start):
+    depth = 0
+    for delimiter in BRACES.finditer(text, start):
+        depth += 1 if delimiter.group() == '{' else -1
+        if depth == 0:
+            return delimiter.start()
+    raise BibTeXError(f"Unbalanced braces in {text[start:start + 60]!r}")
+
+
+def _closing_quote(text, start):
+    depth = 0
+    for position in range(start + 1, len(text)):
+        char = text[position]
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        elif char == '"' and depth == 0:
+            return position
+    raise BibTeXError(f"Unterminated quoted value in {text[start:start + 60]!r}")
+
+
+def _parse_value(text, position, macros):
+    # One value: {braced}, "quoted", a number or a macro, joined with '#'
+    parts = []
+    while True:
+        position = SPACE.match(text, position).end()
+        if position >= len(text):
+            raise BibTeXError(f"Missing value at end of {text[-60:]!r}")
+        char = text[position]
+        if char == '{':
+            end = _matching_brace(text, position)
+            parts.append(text[position + 1:end])
+            position = end + 1
+        elif char == '"':
+            end = _closing_quote(text, position)
+            parts.append(text[position + 1:end])
+            position = end + 1
+        else:
+            match = WORD.match(text, position)
+            if match is None:
+                raise BibTeXError(f"Unexpected {char!r} in {text[position:position + 60]!r}")
+            word = match.group()
+            parts.append(word if word.isdigit() else macros.get(word.lower(), word))
+            position = match.end()
+        position = SPACE.match(text, position).end()
+        if position < len(text) and text[position] == '#':
+            position += 1
+            continue
+        return ' '.join(''.join(parts).split()), position
+
+
+def _parse_fields(text, position, macros):
+    fields = {}
+    while True:
+        position = SEPARATORS.match(text, position).end()
+        if position >= len(text):
+            return fields
+        match = FIELD_NAME.match(text, position)
+        if match is None:
+            raise BibTeXError(f"Expected a field name at {text[position:position + 60]!r}")
+        fields[match.group(1).lower()], position = _parse_value(text, match.end(), macros)
+
+
+def iter_entries(source, macros=None):
+    # Streams BibEntry tuples out of a string or an open text file. Field
+    # names are lowercased; values have their outer braces or quotes removed,
+    # macros expanded and '#' pieces joined, inner braces are kept (see
+    # strip_braces). @string definitions apply to the entries after them;
+    # @comment and @preamble are skipped, as is a malformed entry.
+    macros = dict(MONTHS, **(macros or {}))
+    for kind, body in _blocks(source):
+        if kind in ('comment', 'preamble'):
+            continue
+        try:
+            if kind == 'string':
+                macros.update({name.lower(): value for name, value in _parse_fields(body, 0, macros).items()})
+                continue
+            key, comma, rest = body.partition(',')
+            yield BibEntry(kind, key.strip(), _parse_fields(rest, 0, macros) if comma else {})
+        except BibTeXError as e:
+            logging.warning(f"Skipping malformed @{kind} entry: {e}")
+
+
+def parse_bibtex(text, macros=None):
+    return list(iter_entries(text, macros))
+
+
+def strip_braces(value):
+    # Drops BibTeX's case-protection braces: '{{IEEE}} {T}ransactions' -> 'IEEE Transactions'
+    return re.sub(r'(?<!\\)[{}]', '', value).strip()
+
+
+# Bulk import: one row per entry, in the same columns the scrapers write
+BIB_COLUMNS = ['KEY', 'TYPE', 'AUTHORS', 'YEAR', 'TITLE', 'JOURNAL', 'VOLUME', 'PAGES',
+               'BOOKTITLE', 'ORGANIZATION']
+
+
+def entry_row(entry):
+    def field(*names):
+        for name in names:
+            if entry.fields.get(name):
+                return strip_braces(entry.fields[name])
+        return 'N/A'
+
+    return {
+        'KEY': entry.key,
+        'TYPE': entry.type,
+        'AUTHORS': field('author', 'editor'),
+        'YEAR': field('year'),
+        'TITLE': field('title'),
+        'JOURNAL': field('journal'),
+        'VOLUME': field('volume'),
+        'PAGES': field('pages'),
+        'BOOKTITLE': field('booktitle'),
+        'ORGANIZATION': field('organization', 'publisher', 'institution', 'school'),
+    }
+
+
+def import_bib(bib_file, output_file):
+    # Streams a .bib file of any size into a CSV, JSONL or Parquet file
+    with open(bib_file, mode='r', encoding='utf-8') as file, open_result_sink(output_file, BIB_COLUMNS) as sink:
+        for entry in iter_entries(file):
+            sink.write(typed_row(entry_row(entry)))
+    return sink.rows_written
+
+
+if __name__ == "__main__":
+    # python bibtex.py references.bib references.csv
+    if len(sys.argv) != 3:
+        print("Usage: python bibtex.py <input.bib> <output.csv|.jsonl|.parquet>")
+        sys.exit(1)
+    count = import_bib(sys.argv[1], sys.argv[2])
+    print(f"Imported {count} entries into {sys.argv[2]}")
@@ -1,24 +1,35 @@
 import os
 import psutil
-import time
 import random
 import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import pyperclip as pc
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import re
 from fp.fp import FreeProxy
+from rate_limiter import AdaptiveRateLimiter
+from driver_pool import DriverPool
+from bibtex import parse_bibtex, strip_braces
+
+CitationResult = namedtuple('CitationResult', ['index', 'title', 'year', 'citation', 'error'])
 
 class ScholarCitationFetcher:
-    def __init__(self):
+    def __init__(self, limiter=None, driver_pool=None, lean=True, browsers=1):
         self.logger = self._setup_logger()
-        self.proxies = self._get_proxies()
-        self.driver = self._setup_driver()
+        self.lean = lean  # skip images, fonts, CSS and trackers
+        self.browsers = browsers  # private pool size; more than one drops the shared user profile
+        # Adaptive pacing instead of a random 2-5 s sleep; the jitter keeps it irregular
+        self.limiter = limiter or AdaptiveRateLimiter(host_rate=0.3, jitter=0.5)
+        # Browsers are leased per citation from a driver_pool.DriverPool; pass
+        # a shared one to skip the chrome cleanup and startup entirely
+        self.owns_pool = driver_pool is None
+        if self.owns_pool:
+            self.proxies = self._get_proxies()
+            driver_pool = self._setup_driver_pool()
+        self.driver_pool = driver_pool
 
     def _setup_logger(self):
         logging.basicConfig(level=logging.INFO)
@@ -34,10 +45,11 @@ class ScholarCitationFetcher:
             self.logger.info(f"Fetched {len(proxies)} proxies.")
         return proxies
 
-    def _setup_driver(self):
+    def _setup_driver_pool(self):
         self._close_chrome_instances()
-        options = self._configure_chrome_options()
-        return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+        driver_pool = DriverPool(size=self.browsers, options_factory=self._configure_chrome_options, lean=self.lean)
+        driver_pool.start()
+        return driver_pool
 
     def _close_chrome_instances(self):
         for proc in psutil.process_iter(['name']):
@@ -50,10 +62,11 @@ class ScholarCitationFetcher:
         options.add_argument('--no-sandbox')
         options.add_argument('--disable-dev-shm-usage')
         options.add_argument('--start-maximized')
-        # Add these lines to use your specific user profile
-        options.add_argument('--remote-debugging-port=9222')
-        options.add_argument('--user-data-dir=C:\\Users\\User\\AppData\\Local\\Google\\Chrome\\User Data')
-        options.add_argument('--profile-directory=Profile 9')
+        # Add these lines to use your specific user profile (one browser at a time only)
+        if self.browsers == 1:
+            options.add_argument('--remote-debugging-port=9222')
+            options.add_argument('--user-data-dir=C:\\Users\\User\\AppData\\Local\\Google\\Chrome\\User Data')
+            options.add_argument('--profile-directory=Profile 9')
         #options.add_argument('--headless')
         chrome_path = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
         if not os.path.exists(chrome_path):
@@ -69,75 +82,131 @@ class ScholarCitationFetcher:
 
         return options
 
+    def _get(self, driver, url):
+        self.limiter.acquire(url)
+        driver.get(url)
+        blocked = ('/sorry/' in driver.current_url
+                   or bool(driver.find_elements(By.ID, "captcha-form")))
+        self.limiter.report(url, blocked=blocked)
+        if blocked:
+            self.logger.warning(f"Blocked by Scholar, now at {self.limiter.rate(url):.2f} req/s")
+
     def fetch_citation(self, paper_title, year):
         try:
-            base_url = f"https://scholar.google.com/scholar?hl=en&q={paper_title} {year}"
-            self.driver.get(base_url)
-            time.sleep(random.uniform(2, 5))
-
-            block = self.driver.find_element(By.CSS_SELECTOR, "div.gs_ri")
-            if not block:
-                self.logger.warning("No results found.")
-                return None
-
-            title = block.find_element(By.CSS_SELECTOR, "h3")
-            link = title.find_element(By.TAG_NAME, "a") if title else None
-            if not link:
-                self.logger.warning("Title link not found.")
-                return None
-
-            citation_id = link.get_attribute("data-clk-atid")
-            if not citation_id:
-                self.logger.warning("Citation ID not found.")
-                return None
-
-            cite_url = f"https://scholar.google.com/scholar?hl=en&q=info:{citation_id}:scholar.google.com/&output=cite&scirp=0"
-            self.driver.get(cite_url)
-            time.sleep(random.uniform(2, 5))
-
-            latex_link_tag = self.driver.find_element(By.LINK_TEXT, "BibTeX")
-            if not latex_link_tag:
-                self.logger.warning("BibTeX link not found.")
-                return None
-
-            latex_link = latex_link_tag.get_attribute("href")
-            if not latex_link:
-                self.logger.warning("BibTeX link href not found.")
-                return None
-
-            self.driver.get(latex_link)
-            wait = WebDriverWait(self.driver, 10)
-            pre_element = wait.until(EC.presence_of_element_located((By.TAG_NAME, "pre")))
-            citation = pre_element.text
-
-            return self._parse_bibtex(citation)
-
+            return self._fetch_one(paper_title, year)
         except Exception as e:
             self.logger.error(f"An error occurred: {str(e)}")
             return None
 
-        finally:
-            self.driver.quit()
+    def fetch_citations(self, papers, workers=None):
+        # Resolves (title, year) pairs on the pool's browsers, `workers` at a
+        # time (default: one per browser), and yields a CitationResult as each
+        # finishes, in completion order. `papers` is read lazily, so it can be
+        # a generator over a large file. A failed title comes back with its
+        # error and the batch carries on. The private pool defaults to one
+        # browser (the one on the user profile), which resolves one title at
+        # a time: build the fetcher with browsers > 1, or pass a bigger
+        # driver_pool, for the titles to run concurrently.
+        workers = workers or self.driver_pool.size
+        papers = enumerate(papers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = {}
+
+            def submit():
+                for index, (title, year) in papers:
+                    in_flight[executor.submit(self._fetch_one, title, year)] = (index, title, year)
+                    if len(in_flight) >= workers * 2:
+                        return
+
+            submit()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, title, year = in_flight.pop(future)
+                    try:
+                        citation = future.result()
+                        error = None if citation else 'not found'
+                    except Exception as e:
+                        self.logger.error(f"Failed to fetch the citation for {title!r}: {e}")
+                        citation, error = None, str(e)
+                    yield CitationResult(index, title, year, citation, error)
+                submit()
+
+    def _fetch_one(self, paper_title, year):
+        with self.driver_pool.lease(pages=3) as driver:
+            return self._fetch_citation(driver, paper_title, year)
+
+    def _fetch_citation(self, driver, paper_title, year):
+        base_url = f"https://scholar.google.com/scholar?hl=en&q={paper_title} {year}"
+        self._get(driver, base_url)
+
+        block = driver.find_element(By.CSS_SELECTOR, "div.gs_ri")
+        if not block:
+            self.logger.warning("No results found.")
+            return None
+
+        title = block.find_element(By.CSS_SELECTOR, "h3")
+        link = title.find_element(By.TAG_NAME, "a") if title else None
+        if not link:
+            self.logger.warning("Title link not found.")
+            return None
+
+        citation_id = link.get_attribute("data-clk-atid")
+        if not citation_id:
+            self.logger.warning("Citation ID not found.")
+            return None
+
+        cite_url = f"https://scholar.google.com/scholar?hl=en&q=info:{citation_id}:scholar.google.com/&output=cite&scirp=0"
+        self._get(driver, cite_url)
+
+        latex_link_tag = driver.find_element(By.LINK_TEXT, "BibTeX")
+        if not latex_link_tag:
+            self.logger.warning("BibTeX link not found.")
+            return None
+
+        latex_link = latex_link_tag.get_attribute("href")
+        if not latex_link:
+            self.logger.warning("BibTeX link href not found.")
+            return None
+
+        self._get(driver, latex_link)
+        waiter = WebDriverWait(driver, 10)
+        pre_element = waiter.until(EC.presence_of_element_located((By.TAG_NAME, "pre")))
+        citation = pre_element.text
+
+        return self._parse_bibtex(citation)
+
+    def close(self):
+        if self.owns_pool:
+            self.driver_pool.stop()
 
     def _parse_bibtex(self, bibtex):
+        entries = parse_bibtex(bibtex)
+        fields = entries[0].fields if entries else {}
         data = {
-            'AUTHORS': self._extract_field(bibtex, 'author'),
-            'JOURNAL': self._extract_field(bibtex, 'journal') or self._extract_field(bibtex, 'booktitle') or 'N/A',
-            'VOLUME': self._extract_field(bibtex, 'volume') or 'N/A',
-            'PAGES': self._extract_field(bibtex, 'pages') or 'N/A',
-            'PUBLISHER': self._extract_field(bibtex, 'publisher') or 'N/A'
+            'AUTHORS': self._extract_field(fields, 'author'),
+            'JOURNAL': self._extract_field(fields, 'journal') or self._extract_field(fields, 'booktitle') or 'N/A',
+            'VOLUME': self._extract_field(fields, 'volume') or 'N/A',
+            'PAGES': self._extract_field(fields, 'pages') or 'N/A',
+            'PUBLISHER': self._extract_field(fields, 'publisher') or 'N/A'
         }
         return data
 
-    def _extract_field(self, bibtex, field):
-        match = re.search(rf'{field}\s*=\s*{{(.*?)}}', bibtex, re.IGNORECASE | re.DOTALL)
-        return match.group(1).strip() if match else None
+    def _extract_field(self, fields, field):
+        value = fields.get(field)
+        return strip_braces(value) if value else None
 
 if __name__ == "__main__":
     fetcher = ScholarCitationFetcher()
     result = fetcher.fetch_citation("Autonomous Electromagnetic Signal Analysis and Measurement System", "2024")
     print(result)
 
+    # Several titles in one session, printed as each one resolves
+    papers = [("Autonomous Electromagnetic Signal Analysis and Measurement System", "2024")]
+    for result in fetcher.fetch_citations(papers):
+        print(result.title, result.citation or result.error)
+    fetcher.close()
+
     
     
     
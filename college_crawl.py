@@ -0,0 +1,264 @@
+import logging
+from scholar_2 import PaperScraper
+from crawler import crawl_papers_in_order
+from profile_lister import ProfileLister, list_profile, paper_id
+from profile_index import ProfileIndex
+from paper_dedupe import PaperDedupe
+from response_cache import ResponseCache, CacheMiss
+from crawl_journal import CrawlJournal
+from tor_proxy import TorPool
+from rate_limiter import AdaptiveRateLimiter
+from driver_pool import DriverPool, headless_options
+from result_schema import typed_row
+from crawl_metrics import METRICS
+
+CRAWL_CONCURRENCY = 4  # citation pages fetched in parallel per profile
+TOR_POOL_SIZE = 3  # tor instances the detail-page crawl rotates through
+BROWSER_POOL_SIZE = 2  # warm headless browsers for listing fallbacks and JS-only pages
+BROWSER_BINARY = "C:\\Program Files\\BraveSoftware\\Brave-Browser\\Application\\brave.exe"
+
+# Tor ports of worker 0; worker N adds N * PORT_STRIDE to each of them, so
+# the tor instances of parallel crawl processes never collide
+SCRAPER_SOCKS_PORT = 9055
+SCRAPER_CONTROL_PORT = 9051
+POOL_SOCKS_PORT = 9060
+POOL_CONTROL_PORT = 9160
+PORT_STRIDE = 200
+
+METRICS_FILE = 'crawl_metrics.prom'  # stage latencies and counters, rewritten every 30s (.json for a snapshot)
+
+
+def build_row(hyperlink, paper, citation_metrics, details):
+    # Typed: ints for year and counts, None where Scholar had nothing
+    return typed_row({
+        'full name': hyperlink[0],
+        'substantive post': hyperlink[1],
+        'sex': hyperlink[2],
+        'department': hyperlink[3],
+        'status/registered': hyperlink[4],
+        'title': paper.title,
+        'year': paper.year,
+        'link': paper.link,
+        'citations': citation_metrics['citations'],
+        'h_index': citation_metrics['h_index'],
+        'i10_index': citation_metrics['i10_index'],
+        'title_cites': paper.cites,
+        'authors': details['authors'],
+        'journal': details['journal'],
+        'volume': details['volume'],
+        'pages': details['pages'],
+        'booktitle': details['booktitle'],
+        'organization': details['organization']
+    })
+
+
+def registered_profiles(entries, verbose=True):
+    # [name, post, sex, department, status, list_works URL] for every
+    # registered roster entry with a profile link
+    registered_hyperlinks = []
+    statuses_found = set()
+
+    for entry in entries:
+        status = entry.status
+        if status:
+            statuses_found.add(status)
+        else:
+            statuses_found.add('n/a')
+        if status == 'Registered':
+            if verbose:
+                print(f"Row {entry.row}: Cell value: {status}, Hyperlink: {entry.hyperlink}")
+            if entry.hyperlink:
+                hyperlink_address = entry.hyperlink + '&view_op=list_works&sortby=pubdate'
+                registered_hyperlinks.append([
+                    entry.name,
+                    entry.post,
+                    entry.sex,
+                    entry.department,
+                    status,
+                    hyperlink_address
+                ])
+            elif verbose:
+                print(f"Row {entry.row}: Status is 'Registered' but no hyperlink found")
+        elif verbose:
+            if status:
+                print(f"Row {entry.row}: Status is '{status}'")
+            else:
+                print(f"Row {entry.row}: Status is not set")
+
+    if verbose:
+        print(f"\nFound {len(registered_hyperlinks)} registered hyperlinks")
+        print(f"Statuses found in the sheet: {', '.join(statuses_found)}")
+    return registered_hyperlinks
+
+
+class CollegeCrawler:
+    # Everything one crawl process needs: its own Tor instances, browsers,
+    # scraper and journal, plus the page cache and profile index, which
+    # are SQLite files every process can share. `worker` shifts all Tor
+    # ports by worker * PORT_STRIDE so several crawlers can run side by side
+    # (see shard_crawl.py). `journal_reads` are other journals whose
+    # finished papers and profiles count as done for this one. Without a
+    # `journal_file` only load_listing() and fetch_details() are usable
+    # (see main_scholar.py). A `cache_only` crawler starts no Tor and no
+    # browsers, since nothing it does may touch the network.
+    def __init__(self, journal_file='crawl_journal.jsonl', worker=0, cache_only=False, incremental=False,
+                 concurrency=CRAWL_CONCURRENCY, tor_pool_size=TOR_POOL_SIZE, browser_pool_size=BROWSER_POOL_SIZE,
+                 browser_binary=BROWSER_BINARY, journal_reads=()):
+        self.worker = worker
+        self.incremental = incremental
+        self.concurrency = concurrency
+        offset = worker * PORT_STRIDE
+
+        # Every finished paper is journaled, so a rerun resumes mid-sheet and mid-profile
+        self.journal = CrawlJournal(journal_file, read_paths=journal_reads) if journal_file else None
+
+        # Papers already scraped per profile, for incremental refresh runs
+        self.profile_index = ProfileIndex()
+
+        # Co-authored papers appear on every author's profile: fetch each one once per run
+        self.paper_dedupe = PaperDedupe()
+
+        # Page cache shared by every sheet, so reruns only fetch what changed
+        self.response_cache = ResponseCache(cache_only=cache_only)
+
+        # Tor instances for the concurrent detail-page crawl
+        self.tor_pool = None
+        if not cache_only:
+            self.tor_pool = TorPool(size=tor_pool_size, base_socks_port=POOL_SOCKS_PORT + offset,
+                                    base_control_port=POOL_CONTROL_PORT + offset)
+            self.tor_pool.start()
+
+        # One pacing budget per host and circuit for every fetch path; it speeds up
+        # while Scholar answers cleanly and backs off whenever it blocks us
+        self.rate_limiter = AdaptiveRateLimiter()
+
+        # One set of warm browsers and one scraper (with its own Tor instance) for all sheets
+        socks_port = SCRAPER_SOCKS_PORT + offset
+        self.browser_pool = None
+        if not cache_only:
+            proxy_address = f"socks5://localhost:{socks_port}"
+            self.browser_pool = DriverPool(size=browser_pool_size,
+                                           options_factory=lambda: headless_options(proxy_address, browser_binary),
+                                           lean=True)
+            self.browser_pool.start()
+        self.paper_scraper = PaperScraper(use_tor=not cache_only, fallback=not cache_only,
+                                          cache=self.response_cache, limiter=self.rate_limiter,
+                                          driver_pool=self.browser_pool, socks_port=socks_port,
+                                          control_port=SCRAPER_CONTROL_PORT + offset)
+        proxy = self.paper_scraper.proxy
+        self.profile_lister = ProfileLister(proxies=proxy.proxies if proxy else None, cache=self.response_cache,
+                                            limiter=self.rate_limiter)
+
+    def load_listing(self, hyperlink, known_ids=None):
+        # list_works pages fetched directly; the browser only as a fallback.
+        # None when the listing is not cached in cache-only mode.
+        try:
+            return list_profile(self.profile_lister, self.browser_pool, hyperlink[5], known_ids)
+        except CacheMiss:
+            print(f"Profile listing not cached, skipping {hyperlink[0]}")
+            return None
+
+    def fetch_details(self, papers):
+        # Fetch the detail pages not seen earlier in the run concurrently over
+        # the Tor pool's circuits; the details end up in paper_dedupe. A paper
+        # still blocked or failing after the retry is left out, so lookup()
+        # gives None for it and a rerun fetches it again.
+        to_fetch = self.paper_dedupe.pending(papers)
+        results = crawl_papers_in_order([paper.link for paper in to_fetch], concurrency=self.concurrency,
+                                         pool=self.tor_pool, cache=self.response_cache, limiter=self.rate_limiter)
+
+        for paper, result in zip(to_fetch, results):
+            link = paper.link
+            details = result.details
+            if result.error == 'cache_miss':
+                print(f"Not cached, skipping {link}")
+                continue
+            elif result.error:
+                # Blocked, needs JS or failed: retry through PaperScraper, which can fall back to Chrome
+                print(f"Retrying {link} ({result.error})")
+                METRICS.count('retries')
+                try:
+                    details = self.paper_scraper.scrape_paper_details(link)
+                except Exception as e:
+                    # Network, browser or parse errors: lose this paper, not the whole college
+                    logging.error(f"Retry failed, skipping {link}: {e}")
+                    METRICS.count('failures')
+                    continue
+                # Still blocked: PaperScraper renews its circuit, the limiter has already backed off
+                if self.paper_scraper.is_detected():
+                    print(f"Still blocked, skipping {link}")
+                    continue
+            logging.debug(f"Details for {link}: {details}")
+            self.paper_dedupe.add(paper, details)
+
+    def crawl_profile(self, college_name, hyperlink):
+        # Journals every paper of one profile; False if some could not be fetched
+        journal = self.journal
+        profile = hyperlink[5]
+        print(f"Processing: {hyperlink[0]}")
+        known_ids = self.profile_index.known_ids(profile) if self.incremental else None
+        listing = self.load_listing(hyperlink, known_ids)
+        if listing is None:
+            return False
+        citation_metrics = listing.metrics
+        papers = listing.rows
+
+        print(f"Found {len(papers)} papers for {hyperlink[0]}")
+
+        if self.incremental:
+            # Known papers only get their citation counts refreshed from the listing
+            refreshed = self.profile_index.update_cites(profile, papers)
+            papers = [paper for paper in papers if paper_id(paper.link) not in known_ids]
+            print(f"{len(papers)} new papers, citation counts refreshed for {refreshed} known papers")
+
+        # Resume mid-profile: only papers the journal has not seen yet
+        papers = [paper for paper in papers if not journal.is_paper_done(college_name, profile, paper.link)]
+        profile_complete = True
+        self.fetch_details(papers)
+
+        # Every row gets its paper's details, fetched now or for a co-author earlier
+        for paper in papers:
+            details = self.paper_dedupe.lookup(paper)
+            if details is None:
+                METRICS.count('failures')
+                profile_complete = False
+                continue
+            self.profile_index.add_paper(profile, paper, details)
+            journal.record_paper(college_name, profile, paper.link,
+                                 build_row(hyperlink, paper, citation_metrics, details))
+            METRICS.count('papers')
+
+        if self.incremental:
+            for paper, details in self.profile_index.papers(profile):
+                if paper_id(paper.link) in known_ids and not journal.is_paper_done(college_name, profile, paper.link):
+                    journal.record_paper(college_name, profile, paper.link,
+                                         build_row(hyperlink, paper, citation_metrics, details))
+                    METRICS.count('papers')
+
+        print(f"Current pace: {self.rate_limiter.rate(profile):.2f} requests/s to Scholar")
+        if profile_complete:
+            journal.mark_profile_done(college_name, profile)
+        return profile_complete
+
+    def crawl_profiles(self, college_name, registered_hyperlinks):
+        # True once every profile of the list is complete in the journal
+        college_complete = True
+        for hyperlink in registered_hyperlinks:
+            if self.journal.is_profile_done(college_name, hyperlink[5]):
+                print(f"Skipping {hyperlink[0]}: already complete in the journal")
+                continue
+            if not self.crawl_profile(college_name, hyperlink):
+                college_complete = False
+        return college_complete
+
+    def close(self):
+        self.paper_scraper.close()
+        self.profile_lister.close()
+        if self.browser_pool:
+            self.browser_pool.stop()
+        if self.tor_pool:
+            self.tor_pool.stop()
+        self.response_cache.close()
+        self.profile_index.close()
+        if self.journal:
+            self.journal.close()
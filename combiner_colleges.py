@@ -1,35 +1,146 @@
 import os
-import pandas as pd
+import re
 import glob
+import json
+import shutil
+from urllib.parse import quote
+import pyarrow as pa
+import pyarrow.parquet as pq
+from roster import file_hash
+from result_sink import open_sink
+from result_schema import arrow_schema, typed_frame, read_csv_chunks, FIELDNAMES
 
-# Set the folder path
-folder_path = 'college_data'
-
-# Get all CSV files in the folder
-csv_files = glob.glob(os.path.join(folder_path, '*.csv'))
-
-# Initialize an empty list to store dataframes
-dfs = []
-
-# Process each CSV file
-for file in csv_files:
-    # Read the CSV file, treating 'N/A' and empty fields as NaN
-    df = pd.read_csv(file, na_values=['N/A', ''], keep_default_na=True)
-    
-    # Extract the college name from the file name
-    college_name = os.path.basename(file).split('_')[2].split('.')[0]
-    
-    # Add the COLLEGE column with the extracted name
-    df['COLLEGE'] = college_name
-    
-    # Append the dataframe to the list
-    dfs.append(df)
-
-# Combine all dataframes
-combined_df = pd.concat(dfs, ignore_index=True)
-
-# Save the combined dataframe to a new CSV file
-# Use the 'na_rep' parameter to represent NaN values as 'N/A' in the output
-combined_df.to_csv('combined_college_data.csv', index=False, na_rep='N/A')
-
-print("All CSV files have been combined with the COLLEGE column added.")
\ No newline at end of file
+FOLDER_PATH = 'college_data'
+COMBINED_CSV = 'combined_college_data.csv'
+DATASET_PATH = 'combined_college_data'  # Parquet dataset, one college=<name> partition per input file
+STATE_FILE = '_combine_state.json'  # inside DATASET_PATH: hash of the input behind each partition
+CHUNK_ROWS = 50000
+
+COLLEGE_FILE = re.compile(r'^research_papers_(.+)\.csv$')
+
+SCHEMA = arrow_schema(FIELDNAMES)
+
+
+def college_name(path):
+    # research_papers_<college>.csv -> <college>, underscores and all;
+    # any other CSV is named after its file
+    name = os.path.basename(path)
+    match = COLLEGE_FILE.match(name)
+    return match.group(1) if match else os.path.splitext(name)[0]
+
+
+def partition_path(dataset_path, college):
+    return os.path.join(dataset_path, f"college={quote(college, safe='')}")
+
+
+def typed_chunk(chunk):
+    # Chunk of strings -> the result schema's types; columns missing from
+    # the input are all missing
+    chunk = typed_frame(chunk.reindex(columns=FIELDNAMES).astype('string'))
+    return pa.Table.from_pandas(chunk, schema=SCHEMA, preserve_index=False)
+
+
+def write_partition(csv_file, directory, chunk_rows=CHUNK_ROWS):
+    # Streams one college CSV into <directory>/part-0.parquet, one row group
+    # per chunk; the partition is swapped in only once it is complete
+    staging = directory + '.part'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    rows = 0
+    with pq.ParquetWriter(os.path.join(staging, 'part-0.parquet'), SCHEMA) as writer:
+        for chunk in read_csv_chunks(csv_file, chunk_rows):
+            unknown = [column for column in chunk.columns if column not in SCHEMA.names]
+            if unknown and rows == 0:
+                print(f"Warning: ignoring unknown columns in {csv_file}: {', '.join(unknown)}")
+            writer.write_table(typed_chunk(chunk))
+            rows += len(chunk)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+    return rows
+
+
+def _load_state(dataset_path):
+    try:
+        with open(os.path.join(dataset_path, STATE_FILE), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(dataset_path, state):
+    path = os.path.join(dataset_path, STATE_FILE)
+    with open(path + '.part', 'w', encoding='utf-8') as file:
+        json.dump(state, file, indent=1, ensure_ascii=False)
+    os.replace(path + '.part', path)
+
+
+def _unchanged(previous, csv_file, stat):
+    # Size and mtime first; only a file that was touched gets hashed
+    if previous is None or not os.path.isdir(previous['partition']):
+        return False
+    if previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    return previous['hash'] == file_hash(csv_file)
+
+
+def update_dataset(folder_path=FOLDER_PATH, dataset_path=DATASET_PATH, chunk_rows=CHUNK_ROWS):
+    # Brings the partitioned dataset in line with the college CSVs: changed
+    # or new files replace their college's partition, unchanged ones are
+    # skipped and partitions of deleted files are dropped. Returns the
+    # colleges that were rewritten or removed.
+    os.makedirs(dataset_path, exist_ok=True)
+    state = _load_state(dataset_path)
+    changed = []
+    seen = set()
+    for csv_file in sorted(glob.glob(os.path.join(folder_path, '*.csv'))):
+        college = college_name(csv_file)
+        if college in seen:
+            print(f"Warning: {csv_file} is a second file for {college}, skipping it")
+            continue
+        seen.add(college)
+        stat = os.stat(csv_file)
+        previous = state.get(college)
+        if _unchanged(previous, csv_file, stat):
+            previous.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            continue
+        directory = partition_path(dataset_path, college)
+        rows = write_partition(csv_file, directory, chunk_rows)
+        state[college] = {'source': csv_file, 'partition': directory, 'hash': file_hash(csv_file),
+                          'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'rows': rows}
+        changed.append(college)
+        print(f"Combined {college}: {rows} rows")
+    for college in [college for college in state if college not in seen]:
+        shutil.rmtree(state.pop(college)['partition'], ignore_errors=True)
+        changed.append(college)
+        print(f"Removed {college}: its CSV is gone")
+    _save_state(dataset_path, state)
+    return changed
+
+
+def write_combined_csv(dataset_path=DATASET_PATH, output_file=COMBINED_CSV):
+    # Flat CSV of the whole dataset with a COLLEGE column, streamed one row
+    # group at a time; missing values are left empty
+    state = _load_state(dataset_path)
+    with open_sink(output_file, FIELDNAMES + ['COLLEGE'], flush_rows=CHUNK_ROWS) as sink:
+        for college in sorted(state):
+            parquet_file = pq.ParquetFile(os.path.join(state[college]['partition'], 'part-0.parquet'))
+            for batch in parquet_file.iter_batches():
+                for row in batch.to_pylist():
+                    row['COLLEGE'] = college
+                    sink.write(row)
+    return sink.rows_written
+
+
+def combine(folder_path=FOLDER_PATH, dataset_path=DATASET_PATH, output_file=COMBINED_CSV):
+    changed = update_dataset(folder_path, dataset_path)
+    if changed or not os.path.exists(output_file):
+        rows = write_combined_csv(dataset_path, output_file)
+        print(f"{len(changed)} colleges changed, {output_file} rewritten with {rows} rows")
+    else:
+        print("No college files changed since the last combine")
+    return changed
+
+
+if __name__ == "__main__":
+    combine()
+    print("All CSV files have been combined with the COLLEGE column added.")
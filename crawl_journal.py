@@ -0,0 +1,133 @@
+import os
+import json
+import time
+from result_schema import open_result_sink, typed_row
+
+
+def read_entries(path):
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b'\n'
+
+
+def merge_journals(path, part_paths):
+    # Appends the entries of other journals (e.g. one per crawl process) to
+    # `path` and deletes them; torn lines are dropped on the way
+    merged = 0
+    with open(path, 'a', encoding='utf-8') as file:
+        if file.tell() and not _ends_with_newline(path):
+            file.write('\n')  # close off a line torn by a crash
+        for part_path in part_paths:
+            for entry in read_entries(part_path):
+                file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                merged += 1
+        file.flush()
+        os.fsync(file.fileno())
+    for part_path in part_paths:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return merged
+
+
+class CrawlJournal:
+    # Append-only JSONL record of finished work. Every completed paper is
+    # one line; finished profiles and colleges get a marker line. Writes are
+    # fsynced in batches (every `sync_every` records or `sync_interval`
+    # seconds) so a crash loses at most one batch. A torn last line from a
+    # crash is ignored on load. Finished work recorded in `read_paths`
+    # (other journals, only read) counts as done here too.
+    def __init__(self, path='crawl_journal.jsonl', sync_every=25, sync_interval=5.0, read_paths=()):
+        self.path = path
+        self.read_paths = list(read_paths)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.papers_done = set()
+        self.profiles_done = set()
+        self.colleges_done = set()
+        self._load()
+        self.file = open(path, 'a', encoding='utf-8')
+        if self.file.tell() and not _ends_with_newline(path):
+            self.file.write('\n')  # close off a line torn by a crash
+        self.pending = 0
+        self.last_sync = time.time()
+
+    def _entries(self):
+        return read_entries(self.path)
+
+    def _load(self):
+        entries = (entry for path in self.read_paths + [self.path] for entry in read_entries(path))
+        for entry in entries:
+            kind = entry.get('type')
+            if kind == 'paper':
+                self.papers_done.add((entry['college'], entry['profile'], entry['link']))
+            elif kind == 'profile':
+                self.profiles_done.add((entry['college'], entry['profile']))
+            elif kind == 'college':
+                self.colleges_done.add(entry['college'])
+
+    def _write(self, entry, sync=False):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.pending += 1
+        if sync or self.pending >= self.sync_every or time.time() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.time()
+
+    def is_paper_done(self, college, profile, link):
+        return (college, profile, link) in self.papers_done
+
+    def is_profile_done(self, college, profile):
+        return (college, profile) in self.profiles_done
+
+    def is_college_done(self, college):
+        return college in self.colleges_done
+
+    def record_paper(self, college, profile, link, row):
+        self.papers_done.add((college, profile, link))
+        self._write({'type': 'paper', 'college': college, 'profile': profile, 'link': link, 'row': row})
+
+    def mark_profile_done(self, college, profile):
+        self.profiles_done.add((college, profile))
+        self._write({'type': 'profile', 'college': college, 'profile': profile}, sync=True)
+
+    def mark_college_done(self, college):
+        self.colleges_done.add(college)
+        self._write({'type': 'college', 'college': college}, sync=True)
+
+    def rows(self, college):
+        # Rows for one college in the order they were first recorded; a paper
+        # recorded again (e.g. after a rerun) keeps its place with the new row
+        self.sync()
+        rows = {}
+        for entry in self._entries():
+            if entry.get('type') == 'paper' and entry['college'] == college:
+                rows[(entry['profile'], entry['link'])] = entry['row']
+        return rows.values()
+
+    def rebuild_output(self, college, path, fieldnames):
+        # Streams the college's rows into a sink (CSV, JSONL or Parquet by
+        # extension), which writes a .part file and renames it into place.
+        # Rows journaled before the typed schema are typed on the way.
+        with open_result_sink(path, fieldnames, flush_rows=500) as sink:
+            for row in self.rows(college):
+                sink.write(typed_row(row))
+        return sink.rows_written
+
+    def close(self):
+        self.sync()
+        self.file.close()
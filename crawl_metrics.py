@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Timed stages of a crawl, in pipeline order
+STAGES = ['profile_load', 'profile_page', 'show_more', 'detail_fetch', 'field_extraction', 'detection_check',
+          'tor_renewal', 'sleep']
+
+# Event counters every run reports, even at zero
+EVENTS = ['papers', 'captchas', 'blocks', 'retries', 'renewals', 'failures']
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+
+class Histogram:
+    # Fixed-bucket latency histogram (Prometheus style); quantiles are
+    # interpolated within their bucket, so memory stays constant
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': round(self.sum, 3),
+                'mean': round(self.sum / self.count, 3) if self.count else 0.0,
+                'p50': round(self.quantile(0.5), 3), 'p90': round(self.quantile(0.9), 3),
+                'p99': round(self.quantile(0.99), 3), 'max': round(self.max, 3)}
+
+
+class Metrics:
+    # Stage latencies, event counters and paper throughput for one process.
+    # The fetch paths record into the module's METRICS; a run exports it to
+    # a Prometheus text file (.prom) or a JSON snapshot (.json) every
+    # `interval` seconds with start_export and prints summary() at the end.
+    # `labels` are added to every Prometheus sample (e.g. the worker).
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self.lock = threading.Lock()
+        self.exporter = None
+        self.stop_event = threading.Event()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.stages = {stage: Histogram() for stage in STAGES}
+            self.events = {event: 0 for event in EVENTS}
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start_time)
+
+    def sleep(self, seconds):
+        # time.sleep that shows up as time spent sleeping
+        if seconds > 0:
+            time.sleep(seconds)
+            self.observe('sleep', seconds)
+
+    def count(self, event, n=1):
+        with self.lock:
+            self.events[event] = self.events.get(event, 0) + n
+
+    def papers_per_minute(self):
+        minutes = (time.time() - self.started) / 60
+        return round(self.events['papers'] / minutes, 2) if minutes > 0 else 0.0
+
+    def snapshot(self):
+        with self.lock:
+            return {'labels': self.labels, 'timestamp': round(time.time(), 3),
+                    'uptime_seconds': round(time.time() - self.started, 1),
+                    'papers_per_minute': self.papers_per_minute(),
+                    'events': dict(self.events),
+                    'stages': {stage: histogram.snapshot() for stage, histogram in self.stages.items()}}
+
+    def _labels(self, **extra):
+        labels = dict(self.labels, **extra)
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}' if labels else ''
+
+    def prometheus(self):
+        # Prometheus text exposition format
+        lines = ['# HELP scholar_stage_seconds Time spent per crawl stage',
+                 '# TYPE scholar_stage_seconds histogram']
+        with self.lock:
+            for stage, histogram in self.stages.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'scholar_stage_seconds_bucket{self._labels(stage=stage, le=bound)} {cumulative}')
+                lines.append(f'scholar_stage_seconds_sum{self._labels(stage=stage)} {histogram.sum:.6f}')
+                lines.append(f'scholar_stage_seconds_count{self._labels(stage=stage)} {histogram.count}')
+            lines += ['# HELP scholar_events_total Crawl events (papers, captchas, retries, ...)',
+                      '# TYPE scholar_events_total counter']
+            lines += [f'scholar_events_total{self._labels(event=event)} {count}'
+                      for event, count in self.events.items()]
+        lines += ['# HELP scholar_papers_per_minute Papers finished per minute since the start of the run',
+                  '# TYPE scholar_papers_per_minute gauge',
+                  f'scholar_papers_per_minute{self._labels()} {self.papers_per_minute()}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # .json gets a snapshot, anything else Prometheus text; written to
+        # a .part file and renamed, so scrapers never read half a file
+        text = json.dumps(self.snapshot(), indent=1) if path.endswith('.json') else self.prometheus()
+        with open(path + '.part', 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(path + '.part', path)
+
+    def start_export(self, path, interval=30):
+        def export():
+            while not self.stop_event.wait(interval):
+                self.write(path)
+
+        self.export_path = path
+        self.stop_event.clear()
+        self.exporter = threading.Thread(target=export, daemon=True)
+        self.exporter.start()
+
+    def stop_export(self):
+        # Stops the periodic export and writes the final numbers
+        if self.exporter is not None:
+            self.stop_event.set()
+            self.exporter.join()
+            self.exporter = None
+            self.write(self.export_path)
+
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = [f"{snapshot['events']['papers']} papers in {snapshot['uptime_seconds']:.0f}s "
+                 f"({snapshot['papers_per_minute']} papers/min)",
+                 'Events: ' + ', '.join(f"{event} {count}" for event, count in snapshot['events'].items()),
+                 f"{'stage':<18}{'count':>8}{'total s':>10}{'mean':>8}{'p50':>8}{'p99':>8}{'max':>8}"]
+        for stage, stats in snapshot['stages'].items():
+            if stats['count']:
+                lines.append(f"{stage:<18}{stats['count']:>8}{stats['sum']:>10.1f}{stats['mean']:>8.3f}"
+                             f"{stats['p50']:>8.3f}{stats['p99']:>8.3f}{stats['max']:>8.3f}")
+        return '\n'.join(lines)
+
+
+METRICS = Metrics()  # what every fetch path in this process records into
+
+
+if __name__ == "__main__":
+    import random
+    for _ in range(200):
+        METRICS.observe('detail_fetch', random.lognormvariate(-0.5, 0.6))
+        METRICS.observe('field_extraction', random.uniform(0.001, 0.01))
+        METRICS.count('papers')
+    METRICS.count('captchas', 3)
+    print(METRICS.summary())
+    print(METRICS.prometheus()[:600])
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from fetch_engines import HttpEngine, details_from_html
+from response_cache import CacheMiss
+from crawl_metrics import METRICS
+
+PaperResult = namedtuple('PaperResult', ['index', 'link', 'details', 'error'])
+
+
+def _fetch(engine, link):
+    details = engine.fetch_paper_details(link)
+    if engine.is_detected():
+        return details, 'detected'
+    if engine.needs_browser():
+        return details, 'needs_browser'
+    return details, None
+
+
+async def crawl_papers(links, concurrency=8, per_host=4, per_circuit=2, circuits=None,
+                       engine_factory=HttpEngine, pool=None, cache=None, limiter=None, moves=2):
+    # Yields a PaperResult per link as soon as it completes. `circuits` is a
+    # list of requests-style proxies dicts (one per Tor circuit, None for a
+    # direct connection). Each circuit gets `per_circuit` engines and a link
+    # waits for a free engine, so no circuit ever has more than `per_circuit`
+    # requests in flight; `per_host` and `concurrency` cap the rest.
+    # With a tor_proxy.TorPool the pool picks the circuit for every request
+    # (and its own per_circuit limit applies), skipping circuits that are
+    # renewing or banned; detected pages mark their circuit banned (and
+    # quarantined) and the link moves to another circuit, up to `moves` times.
+    # Links found in `cache` (a response_cache.ResponseCache) are answered
+    # without touching a circuit; fetched pages are stored in it.
+    # A rate_limiter.AdaptiveRateLimiter paces each request per host and circuit.
+    links = list(links)
+    if not links:
+        return
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    if pool is not None:
+        per_circuit = pool.per_circuit
+        circuits = [circuit.proxies for circuit in pool.circuits]
+    circuits = circuits or [None]
+
+    # One engine queue per circuit, plus a shared queue used without a pool
+    circuit_engines = [asyncio.Queue() for _ in circuits]
+    engines = asyncio.Queue()
+    created = []
+    for index, proxies in enumerate(circuits):
+        for _ in range(per_circuit):
+            engine = engine_factory(proxies=proxies, cache=cache, limiter=limiter)
+            created.append(engine)
+            circuit_engines[index].put_nowait(engine)
+            engines.put_nowait(engine)
+
+    async def checkout():
+        if pool is None:
+            return None, await engines.get()
+        circuit = await loop.run_in_executor(None, pool.acquire)
+        return circuit, await circuit_engines[circuit.index].get()
+
+    def checkin(circuit, engine, error):
+        if pool is None:
+            engines.put_nowait(engine)
+        else:
+            circuit_engines[circuit.index].put_nowait(engine)
+            pool.release(circuit, banned=(error == 'detected'))
+
+    in_flight = asyncio.Semaphore(concurrency)
+    host_limits = {}
+
+    async def crawl_one(index, link):
+        if cache is not None:
+            try:
+                body = cache.get(link)
+            except CacheMiss:
+                return PaperResult(index, link, None, 'cache_miss')
+            if body is not None:
+                return PaperResult(index, link, details_from_html(body, link), None)
+
+        host = urlparse(link).netloc
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+        async with in_flight, host_limit:
+            for attempt in range(moves + 1 if pool is not None else 1):
+                if attempt:
+                    logging.info(f"Circuit {circuit.index} blocked at {link}, moving it to another circuit")
+                    METRICS.count('retries')
+                circuit, engine = await checkout()
+                details, error = None, None
+                try:
+                    details, error = await loop.run_in_executor(executor, _fetch, engine, link)
+                except Exception as e:
+                    logging.error(f"Error crawling {link}: {e}")
+                    METRICS.count('failures')
+                    error = str(e)
+                finally:
+                    checkin(circuit, engine, error)
+                if error != 'detected':
+                    break
+        return PaperResult(index, link, details, error)
+
+    tasks = [asyncio.ensure_future(crawl_one(index, link)) for index, link in enumerate(links)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False)
+        for engine in created:
+            engine.close()
+
+
+async def collect_papers(links, **kwargs):
+    results = [None] * len(links)
+    async for result in crawl_papers(links, **kwargs):
+        results[result.index] = result
+    return results
+
+
+def crawl_papers_in_order(links, **kwargs):
+    # Blocking helper for the main scripts: results come back in input order
+    # so the CSV rows line up with the profile listing.
+    links = list(links)
+    return asyncio.run(collect_papers(links, **kwargs))
+
+
+if __name__ == "__main__":
+    # Offline throughput check against the fixture server
+    import time
+    from mock_scholar import start_server, citation_url, citation_fixtures, FakeTorInstance
+    from tor_proxy import TorPool
+
+    logging.basicConfig(level=logging.ERROR)
+    server = start_server(latency=0.2)
+    paper_ids = citation_fixtures()
+    links = [citation_url(server, paper_ids[i % len(paper_ids)], user=f'user{i}') for i in range(40)]
+    try:
+        for concurrency in [1, 4, 16]:
+            start_time = time.time()
+            results = crawl_papers_in_order(links, concurrency=concurrency, per_host=concurrency,
+                                            per_circuit=concurrency)
+            elapsed = time.time() - start_time
+            print(f"concurrency={concurrency}: {len(results)} papers in {elapsed:.2f}s "
+                  f"({len(results) / elapsed:.1f} papers/s)")
+
+        # Same run through a TorPool of fake instances that rotate every 5 papers
+        pool = TorPool(size=4, per_circuit=4, rotate_after=5,
+                       launcher=lambda socks_port, control_port: FakeTorInstance(renew_delay=0.5))
+        pool.start()
+        start_time = time.time()
+        results = crawl_papers_in_order(links, concurrency=16, per_host=16, pool=pool)
+        elapsed = time.time() - start_time
+        print(f"pool of 4: {len(results)} papers in {elapsed:.2f}s")
+        for stats in pool.stats():
+            print(stats)
+        pool.stop()
+    finally:
+        server.shutdown()
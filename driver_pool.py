@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import WebDriverException
+from webdriver_manager.chrome import ChromeDriverManager
+
+DRIVER_PATH_FILE = 'chromedriver_path.txt'
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def driver_path():
+    # ChromeDriverManager().install() checks versions over the network on
+    # every call; resolve the binary once and remember it across runs
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None and os.path.exists(DRIVER_PATH_FILE):
+            with open(DRIVER_PATH_FILE, 'r') as file:
+                path = file.read().strip()
+            if os.path.exists(path):
+                _driver_path = path
+        if _driver_path is None:
+            _driver_path = ChromeDriverManager().install()
+            with open(DRIVER_PATH_FILE, 'w') as file:
+                file.write(_driver_path)
+    return _driver_path
+
+
+def forget_driver_path():
+    # A cached chromedriver can go stale when Chrome updates underneath it
+    global _driver_path
+    with _driver_path_lock:
+        _driver_path = None
+        if os.path.exists(DRIVER_PATH_FILE):
+            os.remove(DRIVER_PATH_FILE)
+
+
+def headless_options(proxy_address=None, binary_location=None):
+    options = Options()
+    options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--window-size=1920,1080')
+    if binary_location:
+        options.binary_location = binary_location
+    if proxy_address:
+        options.add_argument(f'--proxy-server={proxy_address}')
+        options.add_argument('--host-resolver-rules="MAP * ~NOTFOUND, EXCLUDE localhost"')
+    return options
+
+
+# Chrome content settings: 2 = block
+LEAN_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.managed_default_content_settings.stylesheets': 2,
+    'profile.managed_default_content_settings.fonts': 2,
+    'profile.managed_default_content_settings.media_stream': 2,
+}
+
+# URL patterns dropped through CDP before they hit the network. Scholar's own
+# scripts stay allowed, JS-only citation pages need them.
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.css',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*googlesyndication.com*', '*googleadservices.com*', '*/gen_204*',
+]
+
+
+def lean_options(options):
+    # Images, fonts and stylesheets off; get() returns at DOMContentLoaded
+    options.add_experimental_option('prefs', LEAN_PREFS)
+    options.add_argument('--blink-settings=imagesEnabled=false')
+    options.page_load_strategy = 'eager'
+    return options
+
+
+def block_assets(driver):
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+
+
+def track_bytes(options):
+    # Chrome's performance log carries the byte counts page_bytes() adds up
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    return options
+
+
+def page_bytes(driver):
+    # Bytes received over the wire since the last call (None without the log)
+    try:
+        entries = driver.get_log('performance')
+    except WebDriverException:
+        return None
+    total = 0
+    for entry in entries:
+        message = json.loads(entry['message'])['message']
+        if message['method'] == 'Network.loadingFinished':
+            total += message['params'].get('encodedDataLength', 0)
+    return total
+
+
+def launch_chrome(options):
+    try:
+        return webdriver.Chrome(service=Service(driver_path()), options=options)
+    except WebDriverException as e:
+        # Most often a chromedriver that no longer matches Chrome: reinstall once
+        logging.warning(f"Chrome failed to start, reinstalling chromedriver: {e}")
+        forget_driver_path()
+        return webdriver.Chrome(service=Service(driver_path()), options=options)
+
+
+class DriverPool:
+    # Keeps `size` browsers warm and leases them out one at a time, so
+    # scripts and scrapers stop paying browser startup per sheet or per
+    # object. A browser is quit and replaced in the background after
+    # `max_pages` pages, or at once when it crashed. `options_factory`
+    # returns fresh Options for every browser it launches. `lean` skips
+    # images, fonts, stylesheets and trackers, which matters over Tor.
+    # A slot whose browser could not be relaunched is kept as `missing` and
+    # relaunched by the next acquire() that finds no idle browser.
+    def __init__(self, size=2, options_factory=headless_options, max_pages=50, launcher=launch_chrome,
+                 lean=False):
+        self.size = size
+        self.lean = lean
+        self.options_factory = options_factory
+        self.max_pages = max_pages
+        self.launcher = launcher
+        self.idle = queue.Queue()
+        self.pages = {}  # browser -> pages served since launch
+        self.lock = threading.Lock()
+        self.launches = 0
+        self.recycled = 0
+        self.missing = 0
+        self.stopped = False
+
+    def _launch(self):
+        options = track_bytes(self.options_factory())
+        if self.lean:
+            lean_options(options)
+        driver = self.launcher(options)
+        if self.lean:
+            block_assets(driver)
+        with self.lock:
+            self.pages[driver] = 0
+            self.launches += 1
+        return driver
+
+    def _discard(self, driver):
+        with self.lock:
+            self.pages.pop(driver, None)
+            self.recycled += 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _replace(self, attempts=3):
+        for attempt in range(attempts):
+            if self.stopped:
+                return
+            try:
+                driver = self._launch()
+            except Exception as e:
+                logging.error(f"Browser launch failed (attempt {attempt + 1} of {attempts}): {e}")
+                continue
+            if self.stopped:
+                self._discard(driver)
+            else:
+                self.idle.put(driver)
+            return
+        with self.lock:
+            self.missing += 1
+
+    def _claim_missing(self):
+        with self.lock:
+            if self.missing == 0:
+                return False
+            self.missing -= 1
+            return True
+
+    def _launch_for_slot(self):
+        # Launches in the caller's thread; on failure the slot stays missing
+        # and the error goes to the caller instead of the slot being lost
+        try:
+            return self._launch()
+        except Exception as e:
+            with self.lock:
+                self.missing += 1
+            raise WebDriverException(f"Browser launch failed: {e}")
+
+    def start(self):
+        # All browsers start in parallel
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            for driver in executor.map(lambda _: self._launch(), range(self.size)):
+                self.idle.put(driver)
+        print(f"Browser pool started with {self.size} browsers.")
+
+    def _alive(self, driver):
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _next_idle(self, timeout):
+        # Waits in short steps so a slot that goes missing meanwhile is
+        # relaunched here rather than leaving the caller blocked for good
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if self._claim_missing():
+                return self._launch_for_slot()
+            wait = 1.0 if deadline is None else min(1.0, deadline - time.time())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return self.idle.get(timeout=wait)
+            except queue.Empty:
+                pass
+
+    def acquire(self, timeout=None):
+        try:
+            driver = self.idle.get_nowait()
+        except queue.Empty:
+            driver = self._next_idle(timeout)
+        if not self._alive(driver):
+            logging.warning("Browser died while idle, launching a new one")
+            self._discard(driver)
+            driver = self._launch_for_slot()
+        return driver
+
+    def release(self, driver, pages=1, broken=False):
+        with self.lock:
+            self.pages[driver] = self.pages.get(driver, 0) + pages
+            worn_out = self.pages[driver] >= self.max_pages
+        if broken or worn_out or self.stopped:
+            self._discard(driver)
+            threading.Thread(target=self._replace, daemon=True).start()
+        else:
+            self.idle.put(driver)
+
+    @contextmanager
+    def lease(self, pages=1, timeout=None):
+        # A browser for the duration of the block; WebDriver errors mark it broken
+        driver = self.acquire(timeout)
+        broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self.release(driver, pages, broken)
+
+    def stats(self):
+        with self.lock:
+            return {'size': self.size, 'idle': self.idle.qsize(), 'launches': self.launches,
+                    'recycled': self.recycled, 'missing': self.missing}
+
+    def stop(self):
+        self.stopped = True
+        with self.lock:
+            drivers = list(self.pages)
+        for driver in drivers:
+            self._discard(driver)
+        print("Browser pool stopped.")
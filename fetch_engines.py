@@ -0,0 +1,384 @@
+import re
+import time
+import logging
+import requests
+from lxml import html
+from requests.adapters import HTTPAdapter
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import WebDriverException, TimeoutException
+from rate_limiter import circuit_key
+from driver_pool import DriverPool, page_bytes
+from crawl_metrics import METRICS
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+def empty_details():
+    return {
+        'authors': 'N/A',
+        'journal': 'N/A',
+        'volume': 'N/A',
+        'pages': 'N/A',
+        'booktitle': 'N/A',
+        'organization': 'N/A'
+    }
+
+
+def process_authors(match):
+    first_group = match.group(1)[0]
+    if match.group(3):
+        second_group = match.group(2)[0]
+        return f"{match.group(3)} {first_group}. {second_group}."
+    else:
+        return f"{match.group(2)} {first_group}."
+
+
+def format_authors(authors_text):
+    return re.sub(r'(\w+)\s+(\w+)(?:\s+(\w+))?', process_authors, authors_text)
+
+
+# details key -> Scholar field labels, in order of preference
+FIELD_ALIASES = {
+    'authors': ['Authors', 'Inventors'],
+    'journal': ['Journal', 'Book', 'Source'],
+    'volume': ['Volume'],
+    'pages': ['Pages'],
+    'booktitle': ['Conference'],
+    'organization': ['Publisher'],
+}
+
+# Reads every gsc_oci_field/gsc_oci_value pair in one WebDriver round trip
+FIELD_TABLE_SCRIPT = """
+var fields = {};
+document.querySelectorAll('div.gsc_oci_field').forEach(function (field) {
+    var value = field.nextElementSibling;
+    var label = field.textContent.trim();
+    if (value && value.classList.contains('gsc_oci_value') && !(label in fields)) {
+        fields[label] = value.innerText.trim();
+    }
+});
+return fields;
+"""
+
+# Markers of Scholar's block pages in a raw response. 'unusual traffic' is
+# only trusted on a page too small to be a real Scholar page, where it
+# cannot come from a paper title; a near-empty 200 is a throttled exit.
+CAPTCHA_MARKERS = [b'id="captcha-form"', b'id="gs_captcha_f"', b'g-recaptcha']
+TRAFFIC_MARKER = b'unusual traffic'
+BLOCK_PAGE_BYTES = 16 * 1024  # Google's block pages are a few KB, Scholar's own pages far more
+EMPTY_PAGE_BYTES = 64
+
+# The same checks on the page a browser shows (see page_block_reason),
+# alone or together with the field table, so each costs one round trip
+PAGE_STATE_FUNCTION = """
+function pageState() {
+    var text = document.body ? document.body.textContent : '';
+    return {url: location.href,
+            captcha: !!document.querySelector('#captcha-form, #gs_captcha_f, .g-recaptcha'),
+            traffic: text.length < %d && text.indexOf('unusual traffic') >= 0};
+}
+""" % BLOCK_PAGE_BYTES
+BLOCK_SCRIPT = PAGE_STATE_FUNCTION + "return pageState();"
+CITATION_PAGE_SCRIPT = (PAGE_STATE_FUNCTION + "var state = pageState();\nstate.fields = (function () {"
+                        + FIELD_TABLE_SCRIPT + "})();\nreturn state;")
+
+
+def extract_fields(tree):
+    # label -> value for the whole citation table in one pass over the parsed page
+    fields = {}
+    for field in tree.xpath('//div[@class="gsc_oci_field"]'):
+        value = field.getnext()
+        label = field.text_content().strip()
+        if value is not None and value.get('class') == 'gsc_oci_value' and label not in fields:
+            fields[label] = value.text_content().strip()
+    return fields
+
+
+def map_fields(fields, url, aliases=FIELD_ALIASES):
+    details = empty_details()
+    missing = []
+    for key, labels in aliases.items():
+        value = next((fields[label] for label in labels if label in fields), None)
+        if value is None:
+            missing.append(key)
+        else:
+            details[key] = value
+
+    if details['authors'] != 'N/A':
+        details['authors'] = format_authors(details['authors'])
+    if missing:
+        logging.warning(f"Failed to extract {', '.join(missing)} for {url}")
+    return details
+
+
+def details_from_html(body, url, aliases=FIELD_ALIASES):
+    return map_fields(extract_fields(html.fromstring(body)), url, aliases)
+
+
+def block_reason(status_code, url, content):
+    # Why a response is a Scholar block page, or None for a normal page.
+    # Status, final URL and byte scans of the raw body only, no parsing.
+    if url and '/sorry/' in url:
+        return 'sorry redirect'
+    if status_code in (403, 429):
+        return f'HTTP {status_code}'
+    if content is None:
+        return None
+    if any(marker in content for marker in CAPTCHA_MARKERS):
+        return 'captcha'
+    if len(content) < BLOCK_PAGE_BYTES and TRAFFIC_MARKER in content:
+        return 'unusual traffic'
+    if status_code == 200 and len(content.strip()) < EMPTY_PAGE_BYTES:
+        return 'empty page'
+    return None
+
+
+def page_block_reason(state):
+    # block_reason for a browser page, from PAGE_STATE_FUNCTION's pageState()
+    if '/sorry/' in state['url']:
+        return 'sorry redirect'
+    if state['captcha']:
+        return 'captcha'
+    if state['traffic']:
+        return 'unusual traffic'
+    return None
+
+
+def count_block(reason):
+    # Block pages in the run's metrics; captchas are counted on their own too
+    if reason:
+        METRICS.count('blocks')
+        if reason in ('captcha', 'unusual traffic', 'sorry redirect'):
+            METRICS.count('captchas')
+
+
+class HttpEngine:
+    # Fetches citation pages with a pooled requests.Session and parses the
+    # static HTML with lxml. No browser, no JS, no assets. With a
+    # rate_limiter.AdaptiveRateLimiter every request waits for its host and
+    # circuit budget and reports whether it came back blocked.
+    name = 'http'
+
+    def __init__(self, proxies=None, pool_size=10, timeout=30, field_aliases=FIELD_ALIASES, cache=None,
+                 limiter=None):
+        self.field_aliases = field_aliases
+        self.cache = cache
+        self.limiter = limiter
+        self.circuit = circuit_key(proxies)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(HEADERS)
+        if proxies:
+            self.session.proxies.update(proxies)
+        self.timeout = timeout
+        self.status_code = None
+        self.current_url = None
+        self.content = None
+        self.tree = None
+        self.blocked = None  # block_reason of the last page, set as it is fetched
+
+    def load(self, url):
+        if self.limiter:
+            self.limiter.acquire(url, self.circuit)
+        response = self.session.get(url, timeout=self.timeout)
+        self.status_code = response.status_code
+        self.current_url = response.url
+        self.content = response.content
+        with METRICS.timer('detection_check'):
+            self.blocked = block_reason(self.status_code, self.current_url, self.content)
+        count_block(self.blocked)
+        if self.limiter:
+            self.limiter.report(url, self.circuit, self.blocked is not None)
+        # lxml refuses a blank document; the block above already caught it
+        self.tree = html.fromstring(response.content if response.content.strip() else b'<html></html>')
+        return self.tree
+
+    def scrape_paper_details(self, url):
+        body = self.cache.get(url) if self.cache else None
+        if body is not None:
+            self.status_code = 200
+            self.current_url = url
+            self.blocked = None
+            with METRICS.timer('field_extraction'):
+                self.tree = html.fromstring(body)
+                return map_fields(extract_fields(self.tree), url, self.field_aliases)
+        return self.fetch_paper_details(url)
+
+    def fetch_paper_details(self, url):
+        # Network only, no cache lookup. Pages with a field table are stored;
+        # captcha, block and JS-only pages have none and never get cached.
+        with METRICS.timer('detail_fetch'):
+            self.load(url)
+        with METRICS.timer('field_extraction'):
+            fields = extract_fields(self.tree)
+            details = map_fields(fields, url, self.field_aliases)
+        if self.cache and fields:
+            self.cache.put(url, self.content)
+        return details
+
+    def is_detected(self):
+        # Decided when the page came in; this only reports it
+        if self.blocked:
+            logging.warning(f"Blocked ({self.blocked}) at {self.current_url}")
+            return True
+        return False
+
+    def needs_browser(self):
+        # Scholar always renders the citation title server side; a page
+        # without it was either built by JS or is an interstitial we can
+        # only get through in a real browser.
+        if self.tree is None or self.blocked:
+            return False
+        return not self.tree.xpath('//*[@id="gsc_oci_title"]')
+
+    def check_connection(self):
+        try:
+            response = self.session.get("https://www.google.com", timeout=self.timeout)
+            return response.ok
+        except requests.RequestException:
+            return False
+
+    def close(self):
+        self.session.close()
+
+
+def profile_options(proxy_address=None):
+    # The original Chrome setup: visible browser on the local user profile
+    options = Options()
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    # Add these lines to use your specific user profile
+    options.add_argument('--user-data-dir=C:\\Users\\User\\AppData\\Local\\Google\\Chrome\\User Data')
+    options.add_argument('--profile-directory=Profile 9')
+    #options.add_argument('--headless')
+
+    # Set proxy for Chrome
+    if proxy_address:
+        options.add_argument(f'--proxy-server={proxy_address}')
+        options.add_argument('--host-resolver-rules="MAP * ~NOTFOUND, EXCLUDE localhost"')
+    return options
+
+
+# Present once a citation page has rendered its field table, or a block page
+CITATION_READY_SELECTOR = '.gsc_oci_field, #gsc_oci_title, #captcha-form, #gs_captcha_f, .g-recaptcha'
+
+
+def wait_for_citation_page(driver, timeout=10):
+    # With the eager page load strategy get() can return before Scholar's
+    # scripts fill in the table; a timeout just reads whatever is there
+    try:
+        WebDriverWait(driver, timeout).until(
+            lambda d: '/sorry/' in d.current_url or d.find_elements(By.CSS_SELECTOR, CITATION_READY_SELECTOR))
+    except TimeoutException:
+        logging.info(f"Citation page not ready after {timeout}s: {driver.current_url}")
+
+
+def driver_block_reason(driver):
+    # block_reason for the page a browser is showing, in one round trip
+    return page_block_reason(driver.execute_script(BLOCK_SCRIPT))
+
+
+class SeleniumEngine:
+    # The original Chrome path, kept for pages that need JS to render.
+    # Browsers are leased per page from `driver_pool` (a
+    # driver_pool.DriverPool shared with other scrapers); without one the
+    # engine keeps a private one-browser pool on the original profile,
+    # lean (no images, fonts, CSS or trackers) unless `lean` is off.
+    # Bytes and seconds per page are logged and summed in transfer_stats().
+    # `circuit` is the limiter key of the Tor circuit behind the browser;
+    # pass circuit_key() of the proxy's requests dict so it matches the
+    # HttpEngine on the same proxy.
+    name = 'selenium'
+
+    def __init__(self, proxy_address="socks5://localhost:9055", field_aliases=FIELD_ALIASES, cache=None,
+                 limiter=None, driver_pool=None, lean=True, circuit=None):
+        self.field_aliases = field_aliases
+        self.cache = cache
+        self.limiter = limiter
+        self.circuit = circuit if circuit is not None else proxy_address
+        self.from_cache = False
+        self.blocked = None
+        self.current_url = None
+        self.pages_loaded = 0
+        self.bytes_loaded = 0
+        self.seconds_loading = 0.0
+        self.owns_pool = driver_pool is None
+        if self.owns_pool:
+            driver_pool = DriverPool(size=1, options_factory=lambda: profile_options(proxy_address), lean=lean)
+            driver_pool.start()
+        self.driver_pool = driver_pool
+
+    def scrape_paper_details(self, url):
+        body = self.cache.get(url) if self.cache else None
+        self.from_cache = body is not None
+        if self.from_cache:
+            with METRICS.timer('field_extraction'):
+                return details_from_html(body, url, self.field_aliases)
+
+        with self.driver_pool.lease() as driver:
+            if self.limiter:
+                self.limiter.acquire(url, self.circuit)
+            page_bytes(driver)  # drop whatever the browser loaded before this page
+            start_time = time.time()
+            driver.get(url)
+            wait_for_citation_page(driver)
+            seconds = time.time() - start_time
+            METRICS.observe('detail_fetch', seconds)
+            self._record_transfer(url, seconds, page_bytes(driver))
+            # Block markers and the field table come back from one script
+            with METRICS.timer('field_extraction'):
+                state = driver.execute_script(CITATION_PAGE_SCRIPT)
+                fields = state['fields'] or {}
+                details = map_fields(fields, url, self.field_aliases)
+            self.current_url = state['url']
+            self.blocked = page_block_reason(state)
+            count_block(self.blocked)
+            if self.limiter:
+                self.limiter.report(url, self.circuit, self.blocked is not None)
+            if self.cache and fields:
+                self.cache.put(url, driver.page_source)
+        return details
+
+    def _record_transfer(self, url, seconds, size):
+        self.pages_loaded += 1
+        self.seconds_loading += seconds
+        if size is not None:
+            self.bytes_loaded += size
+            logging.info(f"Loaded {url} in {seconds:.1f}s, {size / 1024:.0f} KB")
+
+    def transfer_stats(self):
+        # Average cost of a browser page load, to compare lean and full browsing
+        pages = self.pages_loaded or 1
+        return {'pages': self.pages_loaded,
+                'kb_per_page': round(self.bytes_loaded / 1024 / pages, 1),
+                'seconds_per_page': round(self.seconds_loading / pages, 2)}
+
+    def is_detected(self):
+        if self.from_cache or not self.blocked:
+            return False
+        logging.warning(f"Blocked ({self.blocked}) at {self.current_url}")
+        return True
+
+    def needs_browser(self):
+        return False
+
+    def check_connection(self):
+        try:
+            with self.driver_pool.lease() as driver:
+                driver.get("https://www.google.com")
+                return "google.com" in driver.current_url
+        except WebDriverException:
+            return False
+
+    def close(self):
+        if self.owns_pool:
+            self.driver_pool.stop()
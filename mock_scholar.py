@@ -0,0 +1,256 @@
+import os
+import time
+import zlib
+import random
+import threading
+from html import escape
+from functools import lru_cache
+from collections import Counter
+from lxml import html
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote
+from bibtex import parse_bibtex, strip_braces
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def citation_fixtures(fixtures_dir=FIXTURES_DIR):
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(os.path.join(fixtures_dir, 'citation_for_view')))
+
+
+@lru_cache()
+def static_citation_fixtures(fixtures_dir=FIXTURES_DIR):
+    # Fixtures with a server-rendered field table (no JS-only pages)
+    static = []
+    for paper_id in citation_fixtures(fixtures_dir):
+        with open(os.path.join(fixtures_dir, 'citation_for_view', f'{paper_id}.html'), 'rb') as file:
+            if b'gsc_oci_table' in file.read():
+                static.append(paper_id)
+    return static
+
+
+def cite_fixtures(fixtures_dir=FIXTURES_DIR):
+    # Scholar cluster ids with a saved cite popup and BibTeX entry
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(os.path.join(fixtures_dir, 'cite')))
+
+
+@lru_cache()
+def cite_titles(fixtures_dir=FIXTURES_DIR):
+    # {cluster id: title} from the saved BibTeX entries
+    titles = {}
+    for cid in cite_fixtures(fixtures_dir):
+        with open(os.path.join(fixtures_dir, 'bibtex', f'{cid}.bib'), 'r', encoding='utf-8') as file:
+            entries = parse_bibtex(file.read())
+        titles[cid] = strip_braces(entries[0].fields['title'])
+    return titles
+
+
+def pick_fixture(known, key):
+    # Stable stand-in for ids and queries without a fixture of their own
+    return known[zlib.crc32(key.encode()) % len(known)]
+
+
+def cluster_id(query):
+    # q=info:<cid>:scholar.google.com/ -> <cid>
+    value = query.get('q', [''])[0]
+    return value.split(':')[1] if value.startswith('info:') else None
+
+
+def render_search(q, fixtures_dir=FIXTURES_DIR):
+    # A one-result search page for the saved paper whose title is in `q`
+    titles = cite_titles(fixtures_dir)
+    matches = [cid for cid, title in titles.items() if title.lower() in q.lower()]
+    cid = matches[0] if matches else pick_fixture(sorted(titles), q)
+    return (f'<!doctype html><html><body><div id="gs_res_ccl_mid">'
+            f'<div class="gs_r gs_or gs_scl" data-cid="{cid}" data-did="{cid}" data-aid="{cid}" data-rp="0">'
+            f'<div class="gs_ri"><h3 class="gs_rt"><a id="{cid}" href="/citations?view_op=view_citation&amp;'
+            f'citation_for_view={cid}" data-clk-atid="{cid}">{escape(titles[cid])}</a></h3>'
+            f'<div class="gs_fl"><a href="javascript:void(0)" class="gs_or_cit gs_or_btn">Cite</a></div>'
+            f'</div></div></div></body></html>').encode('utf-8')
+
+
+def render_sorry(continue_url):
+    # Scholar's captcha interstitial
+    return (f'<!doctype html><html><body><div id="infoDiv">Our systems have detected unusual traffic from your '
+            f'computer network.</div><form id="captcha-form" action="index" method="post">'
+            f'<input type="hidden" name="continue" value="{escape(continue_url)}"></form>'
+            f'</body></html>').encode('utf-8')
+
+
+def render_list_works(path, cstart, pagesize):
+    # One page of a saved profile, as Scholar serves it for cstart/pagesize
+    tree = html.parse(path).getroot()
+    rows = tree.xpath('//tr[@class="gsc_a_tr"]')
+    for index, row in enumerate(rows):
+        if not cstart <= index < cstart + pagesize:
+            row.getparent().remove(row)
+    if cstart + pagesize >= len(rows):
+        for button in tree.xpath('//button[@id="gsc_bpf_more"]'):
+            button.set('disabled', '')
+    return html.tostring(tree, doctype='<!doctype html>', encoding='utf-8')
+
+
+class ScholarFixtureHandler(BaseHTTPRequestHandler):
+    # Serves saved Scholar pages from FIXTURES_DIR so the scrapers can be
+    # run offline:
+    #   /citations?...&citation_for_view=USER:PAPER -> citation_for_view/PAPER.html
+    #     (papers without a fixture get one of the static saved pages, picked by id)
+    #   /citations?user=USER&cstart=N&pagesize=M   -> rows N..N+M of list_works/USER.html
+    #   /scholar?q=TITLE                           -> a search result for the saved paper with that title
+    #   /scholar?q=info:CID:...&output=cite        -> cite/CID.html, the cite popup
+    #   /scholar.bib?q=info:CID:...                -> bibtex/CID.bib
+    # `error_rate` of the requests get a 503 and `captcha_rate` are sent to
+    # the /sorry/ captcha page (HTTP 429), as Scholar does when it blocks.
+    fixtures_dir = FIXTURES_DIR
+    latency = 0
+    error_rate = 0
+    captcha_rate = 0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+
+        if parsed.path.startswith('/sorry/'):
+            self.server.count('captcha_pages')
+            self._send(429, render_sorry(query.get('continue', [''])[0]))
+            return
+        roll = self.server.random.random()
+        if roll < self.error_rate:
+            self.server.count('errors')
+            self.send_error(503)
+            return
+        if roll < self.error_rate + self.captcha_rate:
+            self.server.count('captchas')
+            self.send_response(302)
+            self.send_header('Location', f"/sorry/index?continue={quote(self.path, safe='')}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = None
+        content_type = 'text/html; charset=UTF-8'
+        if parsed.path == '/citations' and 'citation_for_view' in query:
+            paper_id = query['citation_for_view'][0].split(':')[-1]
+            path = os.path.join(self.fixtures_dir, 'citation_for_view', f'{paper_id}.html')
+            if not os.path.exists(path):
+                fallback = pick_fixture(static_citation_fixtures(self.fixtures_dir), paper_id)
+                path = os.path.join(self.fixtures_dir, 'citation_for_view', f'{fallback}.html')
+            with open(path, 'rb') as file:
+                body = file.read()
+        elif parsed.path == '/citations' and 'user' in query:
+            path = os.path.join(self.fixtures_dir, 'list_works', f"{query['user'][0]}.html")
+            if os.path.exists(path):
+                cstart = int(query.get('cstart', ['0'])[0])
+                pagesize = int(query.get('pagesize', ['20'])[0])
+                body = render_list_works(path, cstart, pagesize)
+        elif parsed.path == '/scholar' and query.get('output') == ['cite'] and cluster_id(query):
+            body = self._fixture('cite', cluster_id(query), '.html')
+        elif parsed.path == '/scholar.bib' and cluster_id(query):
+            body = self._fixture('bibtex', cluster_id(query), '.bib')
+            content_type = 'text/plain; charset=UTF-8'
+        elif parsed.path == '/scholar' and 'q' in query:
+            body = render_search(query['q'][0], self.fixtures_dir)
+
+        if body is None:
+            self.send_error(404)
+            return
+        self.server.count('pages')
+        self._send(200, body, content_type)
+
+    def _fixture(self, folder, cid, extension):
+        path = os.path.join(self.fixtures_dir, folder, cid + extension)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def _send(self, status, body, content_type='text/html; charset=UTF-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, handler, seed=None):
+        super().__init__(address, handler)
+        self.random = random.Random(seed)
+        self.counts = Counter()  # pages served, errors and captchas injected
+        self.lock = threading.Lock()
+
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] += 1
+
+
+def start_server(port=0, handler=ScholarFixtureHandler, latency=0, error_rate=0, captcha_rate=0, seed=None):
+    # latency (seconds) is added to every response to mimic a Tor round trip;
+    # error_rate and captcha_rate are the share of requests answered with a
+    # 503 or a captcha, drawn from a generator seeded with `seed`
+    overrides = {name: value for name, value in
+                 [('latency', latency), ('error_rate', error_rate), ('captcha_rate', captcha_rate)] if value}
+    if overrides:
+        handler = type(handler.__name__, (handler,), overrides)
+    server = MockServer(('127.0.0.1', port), handler, seed=seed)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+class FakeTorInstance:
+    # Stands in for a TorProxy in TorPool(launcher=...): connects directly
+    # and takes `renew_delay` seconds to "renew".
+    def __init__(self, renew_delay=0):
+        self.proxies = None
+        self.renew_delay = renew_delay
+        self.renewals = 0
+
+    def renew_connection(self):
+        time.sleep(self.renew_delay)
+        self.renewals += 1
+
+    def stop(self):
+        pass
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}'
+
+
+def profile_url(server, user='AbCdEfGAAAAJ'):
+    return f'{base_url(server)}/citations?hl=en&user={user}&view_op=list_works&sortby=pubdate'
+
+
+def citation_url(server, paper_id, user='AbCdEfGAAAAJ'):
+    return f'{base_url(server)}/citations?view_op=view_citation&hl=en&user={user}&citation_for_view={user}:{paper_id}'
+
+
+def search_url(server, title, year=''):
+    return f"{base_url(server)}/scholar?hl=en&q={quote(f'{title} {year}'.strip())}"
+
+
+if __name__ == "__main__":
+    # Runs the HTTP engine against every fixture page, no Tor and no Google.
+    from scholar_2 import PaperScraper
+
+    server = start_server()
+    scraper = PaperScraper(engine='http', use_tor=False, fallback=False)
+    try:
+        for paper_id in citation_fixtures():
+            url = citation_url(server, paper_id)
+            details = scraper.scrape_paper_details(url)
+            print(paper_id, details, 'needs browser' if scraper.engine.needs_browser() else '')
+    finally:
+        scraper.close()
+        server.shutdown()
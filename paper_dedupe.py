@@ -0,0 +1,61 @@
+import re
+from profile_lister import paper_id
+
+MIN_TITLE_WORDS = 4  # shorter titles ("Editorial", "Preface") are too generic to match on
+
+
+def title_key(title, year):
+    words = re.sub(r'\W+', ' ', (title or '').lower()).split()
+    if len(words) < MIN_TITLE_WORDS:
+        return None
+    return ' '.join(words), (year or '').strip()
+
+
+class PaperDedupe:
+    # Run-wide index of fetched detail pages, so a paper listed on several
+    # co-authors' profiles (or in several college sheets) is fetched once
+    # and its details fanned out to every row. A paper is matched by its
+    # citation_for_view id, which repeats when a profile is listed twice,
+    # and by normalized title and year, since each co-author's copy of a
+    # paper gets its own id.
+    def __init__(self):
+        self.details = {}
+        self.references = 0
+        self.fetches = 0
+
+    def _keys(self, paper):
+        keys = [('id', paper_id(paper.link))]
+        title = title_key(paper.title, paper.year)
+        if title is not None:
+            keys.append(('title', title))
+        return keys
+
+    def lookup(self, paper):
+        for key in self._keys(paper):
+            if key in self.details:
+                return self.details[key]
+        return None
+
+    def pending(self, papers):
+        # The papers that still need a detail fetch: one per distinct paper
+        # not seen earlier in the run
+        to_fetch = []
+        planned = set()
+        for paper in papers:
+            self.references += 1
+            keys = self._keys(paper)
+            if any(key in self.details or key in planned for key in keys):
+                continue
+            planned.update(keys)
+            to_fetch.append(paper)
+        self.fetches += len(to_fetch)
+        return to_fetch
+
+    def add(self, paper, details):
+        for key in self._keys(paper):
+            self.details.setdefault(key, details)
+
+    def stats(self):
+        duplicates = self.references - self.fetches
+        return {'references': self.references, 'fetched': self.fetches, 'duplicates': duplicates,
+                'duplicate_rate': round(duplicates / self.references, 3) if self.references else 0.0}
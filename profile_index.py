@@ -0,0 +1,67 @@
+import json
+import time
+import sqlite3
+from urllib.parse import urlparse, parse_qsl
+from profile_lister import PaperRow, paper_id
+
+
+def profile_key(profile_url):
+    return dict(parse_qsl(urlparse(profile_url).query)).get('user', profile_url)
+
+
+class ProfileIndex:
+    # Papers already scraped for each profile, with their listing row and
+    # detail fields, so a refresh run only fetches detail pages for papers
+    # it has never seen. Keyed by the Scholar user id and paper id, so the
+    # extra parameters on a profile URL do not matter.
+    def __init__(self, path='profile_index.sqlite'):
+        # Shared by parallel crawl processes: WAL lets them read while one writes
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS papers (
+            profile TEXT NOT NULL,
+            paper_id TEXT NOT NULL,
+            title TEXT,
+            link TEXT,
+            year TEXT,
+            cites TEXT,
+            details TEXT,
+            first_seen REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (profile, paper_id))''')
+        self.db.commit()
+
+    def known_ids(self, profile_url):
+        rows = self.db.execute('SELECT paper_id FROM papers WHERE profile = ?', (profile_key(profile_url),))
+        return {row[0] for row in rows}
+
+    def add_paper(self, profile_url, paper, details):
+        now = time.time()
+        self.db.execute('''INSERT INTO papers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (profile, paper_id) DO UPDATE SET
+            title = excluded.title, link = excluded.link, year = excluded.year,
+            cites = excluded.cites, details = excluded.details, updated_at = excluded.updated_at''',
+                        (profile_key(profile_url), paper_id(paper.link), paper.title, paper.link,
+                         paper.year, paper.cites, json.dumps(details), now, now))
+        self.db.commit()
+
+    def update_cites(self, profile_url, rows):
+        # Citation counts of known papers come from the listing rows alone
+        now = time.time()
+        key = profile_key(profile_url)
+        updated = 0
+        for paper in rows:
+            cursor = self.db.execute('UPDATE papers SET cites = ?, updated_at = ? WHERE profile = ? AND paper_id = ?',
+                                     (paper.cites, now, key, paper_id(paper.link)))
+            updated += cursor.rowcount
+        self.db.commit()
+        return updated
+
+    def papers(self, profile_url):
+        # (PaperRow, details) for every known paper, newest first
+        rows = self.db.execute('''SELECT title, link, year, cites, details FROM papers WHERE profile = ?
+            ORDER BY CAST(year AS INTEGER) DESC, first_seen''', (profile_key(profile_url),))
+        return [(PaperRow(title, link, year, cites), json.loads(details)) for title, link, year, cites, details in rows]
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,267 @@
+import queue
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse, urljoin
+from lxml import html
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import WebDriverException, TimeoutException
+from fetch_engines import HttpEngine, driver_block_reason, count_block
+from rate_limiter import circuit_key
+from response_cache import CacheMiss
+from crawl_metrics import METRICS
+
+PaperRow = namedtuple('PaperRow', ['title', 'link', 'year', 'cites'])
+ProfileListing = namedtuple('ProfileListing', ['rows', 'metrics'])
+
+METRIC_KEYS = ['citations', 'h_index', 'i10_index']  # the gsc_rsb_st rows, in order
+
+# The publication table and the citation metrics of the page a browser shows,
+# in one WebDriver round trip: [title, href, year, cites] per row (null where
+# the row has no such cell) and the "All" column of gsc_rsb_st
+PROFILE_TABLE_SCRIPT = """
+var text = function (element) { return element ? element.textContent.trim() : null; };
+var rows = [];
+document.querySelectorAll('tr.gsc_a_tr').forEach(function (row) {
+    var title = row.querySelector('a.gsc_a_at');
+    if (title) {
+        rows.push([text(title), title.getAttribute('data-href') || title.getAttribute('href'),
+                   text(row.querySelector('span.gsc_a_h')), text(row.querySelector('a.gsc_a_ac'))]);
+    }
+});
+var metrics = [];
+document.querySelectorAll('#gsc_rsb_st tbody tr').forEach(function (row) {
+    metrics.push(text(row.querySelector('td.gsc_rsb_std')));
+});
+return {url: location.href, rows: rows, metrics: metrics};
+"""
+
+# Clicks "Show more" if it is still enabled; false once the list is complete
+# Clicks "Show more" and returns the row count before the click, or null
+# once the button is gone or disabled (the whole list is shown)
+SHOW_MORE_SCRIPT = """
+var button = document.getElementById('gsc_bpf_more');
+if (!button || button.disabled) { return null; }
+var rows = document.querySelectorAll('tr.gsc_a_tr').length;
+button.scrollIntoView(true);
+button.click();
+return rows;
+"""
+ROW_COUNT_SCRIPT = "return document.querySelectorAll('tr.gsc_a_tr').length;"
+SHOW_MORE_TIMEOUT = 10  # seconds a click may take to add rows
+
+
+class ProfileBlocked(Exception):
+    pass
+
+
+def empty_metrics():
+    return {'citations': 'N/A', 'h_index': 'N/A', 'i10_index': 'N/A'}
+
+
+def list_works_url(profile_url, cstart=0, pagesize=100):
+    parsed = urlparse(profile_url)
+    query = dict(parse_qsl(parsed.query))
+    query.update({'view_op': 'list_works', 'cstart': str(cstart), 'pagesize': str(pagesize)})
+    return urlunparse(parsed._replace(query=urlencode(query)))
+
+
+def paper_id(link):
+    # citation_for_view=USER:PAPER -> PAPER
+    value = dict(parse_qsl(urlparse(link).query)).get('citation_for_view', '')
+    return value.split(':')[-1] or None
+
+
+def paper_row(base_url, title, href, year, cites):
+    # Missing year or citation cells read 'N/A', as they always have
+    return PaperRow(title=title, link=urljoin(base_url, href),
+                    year='N/A' if year is None else year, cites='N/A' if cites is None else cites)
+
+
+def parse_profile_rows(tree, base_url):
+    # One PaperRow per publication row, so a row without a year or citation
+    # count cannot shift the values of the rows after it. Each row's cells
+    # are picked up in a single walk over it.
+    rows = []
+    for row in tree.iterfind('.//tr[@class]'):
+        if 'gsc_a_tr' not in row.get('class').split():
+            continue
+        title_link = year = cites = None
+        for element in row.iterdescendants('a', 'span'):
+            classes = (element.get('class') or '').split()
+            if title_link is None and element.tag == 'a' and 'gsc_a_at' in classes:
+                title_link = element
+            elif year is None and element.tag == 'span' and 'gsc_a_h' in classes:
+                year = element.text_content().strip()
+            elif cites is None and element.tag == 'a' and 'gsc_a_ac' in classes:
+                cites = element.text_content().strip()
+        if title_link is None:
+            continue
+        rows.append(paper_row(base_url, title_link.text_content().strip(),
+                              title_link.get('data-href') or title_link.get('href'), year, cites))
+    return rows
+
+
+def citation_metrics(values):
+    # The "All" column of gsc_rsb_st, top to bottom -> metrics dict
+    metrics = empty_metrics()
+    for key, value in zip(METRIC_KEYS, values):
+        if value is not None:
+            metrics[key] = value
+    return metrics
+
+
+def parse_citation_metrics(tree):
+    values = []
+    for row in tree.xpath('//table[@id="gsc_rsb_st"]/tbody/tr'):
+        cells = row.xpath('./td[contains(concat(" ", @class, " "), " gsc_rsb_std ")]')
+        values.append(cells[0].text_content().strip() if cells else None)
+    return citation_metrics(values)
+
+
+def parse_profile_page(tree, base_url):
+    # A parsed list_works page -> its rows and metrics
+    return ProfileListing(parse_profile_rows(tree, base_url), parse_citation_metrics(tree))
+
+
+def profile_from_script(result):
+    # PROFILE_TABLE_SCRIPT's result -> ProfileListing
+    rows = [paper_row(result['url'], *row) for row in result['rows']]
+    return ProfileListing(rows, citation_metrics(result['metrics']))
+
+
+class ProfileLister:
+    # Lists a profile's publications by requesting list_works pages
+    # directly with cstart/pagesize instead of clicking "Show more".
+    # After the first page, `parallel` page offsets are fetched at a time.
+    # Pages go through `cache` (a response_cache.ResponseCache) when given,
+    # and are paced by `limiter` (a rate_limiter.AdaptiveRateLimiter).
+    def __init__(self, proxies=None, cache=None, pagesize=100, parallel=3, engine_factory=HttpEngine,
+                 limiter=None):
+        self.cache = cache
+        self.pagesize = pagesize
+        self.parallel = parallel
+        self.limiter = limiter
+        self.circuit = circuit_key(proxies)
+        self.engines = queue.Queue()
+        self.created = [engine_factory(proxies=proxies, limiter=limiter) for _ in range(parallel)]
+        for engine in self.created:
+            self.engines.put(engine)
+        self.executor = ThreadPoolExecutor(max_workers=parallel)
+
+    def _fetch_page(self, url):
+        body = self.cache.get(url) if self.cache else None
+        if body is not None:
+            return html.fromstring(body)
+
+        engine = self.engines.get()
+        try:
+            with METRICS.timer('profile_page'):
+                tree = engine.load(url)
+            if engine.is_detected():
+                raise ProfileBlocked(url)
+            if engine.status_code != 200 or not tree.xpath('//*[@id="gsc_a_t"]'):
+                raise ProfileBlocked(f"No publication table ({engine.status_code}) at {url}")
+            if self.cache:
+                self.cache.put(url, engine.content)
+            return tree
+        finally:
+            self.engines.put(engine)
+
+    def list_profile(self, profile_url, known_ids=None):
+        # With known_ids (paper ids from an earlier run) paging stops at the
+        # first page holding a known paper: the listing is sorted by
+        # publication date, so everything after it was seen before. Pages
+        # are then fetched one at a time, since the first usually suffices.
+        def reached_known(page_rows):
+            return bool(known_ids) and any(paper_id(row.link) in known_ids for row in page_rows)
+
+        first_url = list_works_url(profile_url, 0, self.pagesize)
+        rows, metrics = parse_profile_page(self._fetch_page(first_url), first_url)
+
+        more = len(rows) == self.pagesize and not reached_known(rows)
+        batch = 1 if known_ids else self.parallel
+        cstart = self.pagesize
+        while more:
+            urls = [list_works_url(profile_url, cstart + i * self.pagesize, self.pagesize)
+                    for i in range(batch)]
+            pages = list(self.executor.map(self._fetch_page, urls))
+            for url, page in zip(urls, pages):
+                page_rows = parse_profile_rows(page, url)
+                rows.extend(page_rows)
+                more = len(page_rows) == self.pagesize and not reached_known(page_rows)
+                if not more:
+                    break
+            cstart += batch * self.pagesize
+
+        return ProfileListing(rows, metrics)
+
+    def close(self):
+        self.executor.shutdown()
+        for engine in self.created:
+            engine.close()
+
+
+def rows_added(driver, rows, timeout=SHOW_MORE_TIMEOUT):
+    # Waits for a "Show more" click to grow the table past `rows`
+    try:
+        WebDriverWait(driver, timeout).until(lambda d: d.execute_script(ROW_COUNT_SCRIPT) > rows)
+        return True
+    except TimeoutException:
+        return False
+
+
+def browse_profile(driver, profile_url, limiter=None, circuit=None):
+    # Selenium fallback: load the profile, click "Show more" until done,
+    # then read every row and the citation metrics in one script. The page
+    # load and every click (each one is a request to Scholar) wait for
+    # `limiter` and report back to it whether Scholar answered with a block.
+    if limiter:
+        limiter.acquire(profile_url, circuit)
+    with METRICS.timer('profile_page'):
+        driver.get(profile_url)
+    blocked = driver_block_reason(driver)
+    count_block(blocked)
+    if limiter:
+        limiter.report(profile_url, circuit, blocked is not None)
+
+    while True:
+        if limiter:
+            limiter.acquire(profile_url, circuit)
+        with METRICS.timer('show_more'):
+            try:
+                rows = driver.execute_script(SHOW_MORE_SCRIPT)
+            except WebDriverException:
+                break
+            if rows is None:
+                break
+            grew = rows_added(driver, rows)
+        blocked = driver_block_reason(driver)
+        count_block(blocked)
+        if limiter:
+            limiter.report(profile_url, circuit, blocked is not None)
+        if blocked or not grew:
+            logging.warning(f"Show more stopped at {rows} rows for {profile_url}: {blocked or 'no new rows'}")
+            break
+
+    with METRICS.timer('field_extraction'):
+        return profile_from_script(driver.execute_script(PROFILE_TABLE_SCRIPT))
+
+
+def list_profile(lister, browsers, profile_url, known_ids=None):
+    # Direct pages first; a browser leased from `browsers` (a
+    # driver_pool.DriverPool) only when Scholar will not serve them; with
+    # no `browsers` the direct listing's error is raised as is.
+    # The whole listing counts as the profile_load stage.
+    with METRICS.timer('profile_load'):
+        try:
+            return lister.list_profile(profile_url, known_ids)
+        except CacheMiss:
+            raise
+        except Exception as e:
+            if browsers is None:
+                raise
+            logging.warning(f"Direct listing failed for {profile_url}: {e}")
+        print(f"Falling back to the browser for {profile_url}")
+        with browsers.lease() as driver:
+            return browse_profile(driver, profile_url, lister.limiter, lister.circuit)
@@ -0,0 +1,151 @@
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlparse
+from crawl_metrics import METRICS
+
+
+class TokenBucket:
+    # Refills at `rate` tokens per second up to `burst` tokens; one token
+    # per request. The rate itself moves with AIMD: `increase` adds a fixed
+    # step after a clean response, `decrease` multiplies it down after a
+    # block, always staying within [min_rate, max_rate].
+    def __init__(self, rate, burst=2, min_rate=0.05, max_rate=10.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.successes = 0
+        self.blocks = 0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        # Seconds until a token is available (0 if one is there now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def increase(self, step):
+        self.successes += 1
+        self.rate = min(self.max_rate, self.rate + step)
+
+    def decrease(self, factor):
+        self.blocks += 1
+        self.rate = max(self.min_rate, self.rate * factor)
+        self.tokens = min(self.tokens, 0)  # drop the burst so the next request waits a full interval
+
+
+class AdaptiveRateLimiter:
+    # Shared pacing for every fetch path. Each request needs a token from its
+    # host's bucket and, when it goes through a proxy, from that circuit's
+    # bucket, so one busy circuit cannot use up the whole host budget and one
+    # flagged exit cannot slow the others down. Rates creep up while responses
+    # are clean and are cut by `decrease` on every block, so the crawl settles
+    # at the fastest pace Scholar tolerates. `jitter` adds up to that fraction
+    # of the interval as random extra wait. Thread safe.
+    def __init__(self, host_rate=1.0, circuit_rate=0.5, max_host_rate=8.0, max_circuit_rate=2.0,
+                 min_rate=0.05, increase=0.05, decrease=0.5, burst=2, jitter=0.0):
+        self.host_rate = host_rate
+        self.circuit_rate = circuit_rate
+        self.max_host_rate = max_host_rate
+        self.max_circuit_rate = max_circuit_rate
+        self.min_rate = min_rate
+        self.step = increase
+        self.factor = decrease
+        self.burst = burst
+        self.jitter = jitter
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, kind, key):
+        bucket = self.buckets.get((kind, key))
+        if bucket is None:
+            if kind == 'host':
+                bucket = TokenBucket(self.host_rate, self.burst, self.min_rate, self.max_host_rate)
+            else:
+                bucket = TokenBucket(self.circuit_rate, self.burst, self.min_rate, self.max_circuit_rate)
+            self.buckets[(kind, key)] = bucket
+        return bucket
+
+    def _buckets(self, url, circuit):
+        buckets = [self._bucket('host', urlparse(url).netloc)]
+        if circuit is not None:
+            buckets.append(self._bucket('circuit', circuit))
+        return buckets
+
+    def acquire(self, url, circuit=None):
+        # Blocks until both the host and the circuit can take another request
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                buckets = self._buckets(url, circuit)
+                for bucket in buckets:
+                    bucket.refill(now)
+                wait = max(bucket.wait_time() for bucket in buckets)
+                if wait == 0:
+                    for bucket in buckets:
+                        bucket.take()
+                    rate = min(bucket.rate for bucket in buckets)
+                    break
+            METRICS.sleep(wait)
+        if self.jitter:
+            METRICS.sleep(random.uniform(0, self.jitter / rate))
+
+    def success(self, url, circuit=None):
+        with self.lock:
+            for bucket in self._buckets(url, circuit):
+                bucket.increase(self.step)
+
+    def blocked(self, url, circuit=None):
+        with self.lock:
+            buckets = self._buckets(url, circuit)
+            for bucket in buckets:
+                bucket.decrease(self.factor)
+            rate = min(bucket.rate for bucket in buckets)
+        logging.warning(f"Blocked on {urlparse(url).netloc} via {circuit}, backing off to {rate:.2f} req/s")
+
+    def report(self, url, circuit=None, blocked=False):
+        if blocked:
+            self.blocked(url, circuit)
+        else:
+            self.success(url, circuit)
+
+    def reset(self, circuit):
+        # A renewed circuit has a fresh exit, so it starts over at circuit_rate
+        with self.lock:
+            self.buckets.pop(('circuit', circuit), None)
+
+    def rate(self, url, circuit=None):
+        # Current requests/s allowed for this host and circuit
+        with self.lock:
+            return min(bucket.rate for bucket in self._buckets(url, circuit))
+
+    def rates(self):
+        # {('host'|'circuit', key): {'rate', 'successes', 'blocks'}} for logging
+        with self.lock:
+            return {key: {'rate': round(bucket.rate, 3), 'successes': bucket.successes, 'blocks': bucket.blocks}
+                    for key, bucket in self.buckets.items()}
+
+
+def circuit_key(proxies):
+    # Requests-style proxies dict -> key of the circuit behind it
+    return proxies.get('https') or proxies.get('http') if proxies else None
+
+
+if __name__ == "__main__":
+    # AIMD walk-through: clean responses speed up, a block halves the rate
+    limiter = AdaptiveRateLimiter(host_rate=4.0, circuit_rate=1.0, increase=0.25)
+    url = 'https://scholar.google.com/citations'
+    start_time = time.time()
+    for i in range(12):
+        limiter.acquire(url, 'circuit-0')
+        limiter.report(url, 'circuit-0', blocked=(i == 8))
+        print(f"{time.time() - start_time:5.2f}s request {i}: {limiter.rate(url, 'circuit-0'):.2f} req/s")
+    print(limiter.rates())
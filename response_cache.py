@@ -0,0 +1,138 @@
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+DAY = 24 * 60 * 60
+
+# Seconds a cached page stays fresh, by page type. Paper metadata hardly
+# ever changes; profile listings gain papers and citations all the time.
+PAGE_TTLS = {
+    'citation': 180 * DAY,
+    'profile': 1 * DAY,
+    'other': 7 * DAY,
+}
+
+# Puts between re-reading the cache size from SQLite; in between it is kept
+# as a running total, which misses what other processes write
+SIZE_SYNC_PUTS = 500
+
+# Query parameters that do not change the page content
+IGNORED_PARAMS = {'oi', 'authuser'}
+
+
+class CacheMiss(Exception):
+    pass
+
+
+def normalize_url(url):
+    parsed = urlparse(url.strip())
+    query = sorted((key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=False)
+                   if key not in IGNORED_PARAMS)
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path or '/', '',
+                       urlencode(query), ''))
+
+
+def page_type(url):
+    query = dict(parse_qsl(urlparse(url).query))
+    if 'citation_for_view' in query:
+        return 'citation'
+    if query.get('view_op') == 'list_works' or ('user' in query and urlparse(url).path == '/citations'):
+        return 'profile'
+    return 'other'
+
+
+class ResponseCache:
+    # SQLite-backed page cache keyed by normalized URL. Bodies are stored
+    # zlib-compressed; once the cache grows past max_bytes the least recently
+    # used entries are evicted. With cache_only set, a miss raises CacheMiss
+    # instead of letting the caller go to the network.
+    def __init__(self, path='scholar_cache.sqlite', ttls=PAGE_TTLS, max_bytes=512 * 1024 * 1024,
+                 cache_only=False):
+        self.path = path
+        self.ttls = dict(PAGE_TTLS, **ttls)
+        self.max_bytes = max_bytes
+        self.cache_only = cache_only
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            page_type TEXT NOT NULL,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL)''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)')
+        self.db.commit()
+        self.total_bytes = self._stored_bytes()
+        self.unsynced_puts = 0
+
+    def _stored_bytes(self):
+        return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    def get(self, url):
+        key = normalize_url(url)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT body, page_type, fetched_at FROM pages WHERE url = ?', (key,)).fetchone()
+            fresh = row is not None and (self.cache_only or now - row[2] < self.ttls[row[1]])
+            if fresh:
+                self.db.execute('UPDATE pages SET accessed_at = ? WHERE url = ?', (now, key))
+                self.db.commit()
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if fresh:
+            return zlib.decompress(row[0]).decode('utf-8')
+        if self.cache_only:
+            raise CacheMiss(url)
+        return None
+
+    def put(self, url, body):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        compressed = zlib.compress(body)
+        now = time.time()
+        key = normalize_url(url)
+        with self.lock:
+            replaced = self.db.execute('SELECT size FROM pages WHERE url = ?', (key,)).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                            (key, page_type(url), compressed, len(compressed), now, now))
+            self.db.commit()
+            self.total_bytes += len(compressed) - (replaced[0] if replaced else 0)
+            self.unsynced_puts += 1
+            if self.unsynced_puts >= SIZE_SYNC_PUTS:
+                self.total_bytes = self._stored_bytes()
+                self.unsynced_puts = 0
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # The running total says we are over; check against the table first
+        total = self.total_bytes = self._stored_bytes()
+        self.unsynced_puts = 0
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used pages until we are back under 90% of the limit
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for url, size in self.db.execute('SELECT url, size FROM pages ORDER BY accessed_at'):
+            stale.append((url,))
+            freed += size
+            if freed >= target:
+                break
+        self.db.executemany('DELETE FROM pages WHERE url = ?', stale)
+        self.db.commit()
+        self.total_bytes -= freed
+        logging.info(f"Evicted {len(stale)} cached pages ({freed} bytes)")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,128 @@
+import os
+import re
+from result_sink import open_sink, ParquetSink
+
+# Column types of result rows, by lowercased column name, so the scripts'
+# 'year' and 'YEAR' columns agree. Any other column is text.
+INT_FIELDS = {'year', 'citations', 'h_index', 'i10_index', 'title_cites'}
+CATEGORY_FIELDS = {'college', 'department', 'substantive post', 'sex', 'status/registered', 'type'}
+
+# Columns of a per-college result file, in order
+FIELDNAMES = ['full name', 'substantive post', 'sex', 'department', 'status/registered',
+              'title', 'link', 'year', 'citations', 'h_index', 'i10_index', 'title_cites',
+              'authors', 'journal', 'volume', 'pages', 'booktitle', 'organization']
+
+MISSING = {'', 'N/A'}  # what the scrapers put in a field they could not fill
+LEADING_INT = re.compile(r'\s*(\d[\d,]*)')
+
+
+def field_type(name):
+    name = name.lower()
+    if name in INT_FIELDS:
+        return 'int'
+    if name in CATEGORY_FIELDS:
+        return 'category'
+    return 'string'
+
+
+def to_int(value):
+    # '1,234' -> 1234, '12*' (merged citations) -> 12, 'N/A' -> None
+    if value is None or isinstance(value, int):
+        return value
+    match = LEADING_INT.match(str(value))
+    return int(match.group(1).replace(',', '')) if match else None
+
+
+def to_text(value):
+    if value is None:
+        return None
+    value = str(value)
+    return None if value.strip() in MISSING else value
+
+
+def int_column(series):
+    # to_int over a pandas string Series. str.extract searches anywhere in
+    # the value, so anchor it like LEADING_INT.match ('Vol 3' is not 3)
+    import pandas as pd
+    digits = series.str.extract('^' + LEADING_INT.pattern, expand=False).str.replace(',', '')
+    return pd.to_numeric(digits, errors='coerce').astype('Int32')
+
+
+def typed_row(row):
+    # Scraped row (all strings, 'N/A' for missing) -> ints for counts and
+    # year, None for anything missing. Typed rows pass through unchanged.
+    return {name: to_int(value) if field_type(name) == 'int' else to_text(value) for name, value in row.items()}
+
+
+def arrow_schema(fieldnames):
+    # Ints as nullable int32, categories dictionary-encoded
+    import pyarrow as pa
+    types = {'int': pa.int32(), 'category': pa.dictionary(pa.int32(), pa.string()), 'string': pa.string()}
+    return pa.schema([(name, types[field_type(name)]) for name in fieldnames])
+
+
+def pandas_dtypes(fieldnames):
+    types = {'int': 'Int32', 'category': 'category', 'string': 'string'}
+    return {name: types[field_type(name)] for name in fieldnames}
+
+
+def open_result_sink(path, fieldnames, **kwargs):
+    # open_sink, with the typed schema for Parquet output. Rows should be
+    # typed (see typed_row); CSV and JSONL write missing values as empty/null.
+    if os.path.splitext(path)[1].lower() == '.parquet':
+        return ParquetSink(path, fieldnames, schema=arrow_schema(fieldnames), **kwargs)
+    return open_sink(path, fieldnames, **kwargs)
+
+
+def typed_frame(frame):
+    # Result columns read as strings -> their typed dtypes
+    for name, dtype in pandas_dtypes(frame.columns).items():
+        if dtype == 'Int32':
+            frame[name] = int_column(frame[name])
+        elif dtype == 'category':
+            frame[name] = frame[name].astype('category')
+    return frame
+
+
+def read_csv_chunks(path, chunksize=None):
+    # Result CSV read as strings, 'N/A' and blanks as missing
+    import pandas as pd
+    return pd.read_csv(path, dtype='string', na_values=sorted(MISSING), keep_default_na=False,
+                       chunksize=chunksize, encoding='utf-8')
+
+
+def read_results(path):
+    # A result CSV or Parquet file as a typed DataFrame; older CSVs with
+    # 'N/A' and '1,234' in them load the same as new ones
+    import pandas as pd
+    if os.path.splitext(path)[1].lower() == '.parquet':
+        return pd.read_parquet(path, dtype_backend='numpy_nullable')
+    return typed_frame(read_csv_chunks(path))
+
+
+def convert_results(csv_file, output_file, chunk_rows=50000):
+    # Rewrites a result CSV (e.g. college_data/research_papers_CoICT.csv)
+    # as typed, dictionary-encoded Parquet, one row group per chunk
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = None
+    writer = None
+    for chunk in read_csv_chunks(csv_file, chunk_rows):
+        if writer is None:
+            schema = arrow_schema(chunk.columns)
+            writer = pq.ParquetWriter(output_file + '.part', schema)
+        writer.write_table(pa.Table.from_pandas(typed_frame(chunk), schema=schema, preserve_index=False))
+    if writer is None:
+        raise ValueError(f"{csv_file} has no header")
+    writer.close()
+    os.replace(output_file + '.part', output_file)
+
+
+if __name__ == "__main__":
+    # python result_schema.py research_papers.csv research_papers.parquet
+    import sys
+    if len(sys.argv) != 3:
+        print("Usage: python result_schema.py <results.csv> <results.parquet>")
+        sys.exit(1)
+    convert_results(sys.argv[1], sys.argv[2])
+    print(f"{sys.argv[1]}: {os.path.getsize(sys.argv[1])} bytes -> {sys.argv[2]}: {os.path.getsize(sys.argv[2])} bytes")
@@ -0,0 +1,180 @@
+import os
+import csv
+import json
+import time
+
+
+class RowSink:
+    # Streams result rows to disk instead of collecting them in memory.
+    # Rows are buffered and flushed every `flush_rows` rows or
+    # `flush_interval` seconds, whichever comes first. The file being written
+    # is `<name>.part`; it is renamed into place once complete, so readers
+    # never see a half-written file under the final name. With `rotate_rows`
+    # set, output is split into numbered files of at most that many rows,
+    # each renamed into place as soon as it is full.
+
+    def __init__(self, path, fieldnames, flush_rows=100, flush_interval=5.0, rotate_rows=None):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rotate_rows = rotate_rows
+        self.buffer = []
+        self.rows_written = 0
+        self.file_rows = 0
+        self.file_index = 0
+        self.files = []
+        self.current_path = None
+        self.last_flush = time.time()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _target_path(self):
+        if self.rotate_rows is None:
+            return self.path
+        root, extension = os.path.splitext(self.path)
+        return f"{root}_{self.file_index:04d}{extension}"
+
+    def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.flush_rows or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        while self.buffer:
+            if self.current_path is None:
+                self.current_path = self._target_path()
+                self._open(self.current_path + '.part')
+            room = len(self.buffer) if self.rotate_rows is None else self.rotate_rows - self.file_rows
+            rows, self.buffer = self.buffer[:room], self.buffer[room:]
+            self._write_rows(rows)
+            self.file_rows += len(rows)
+            self.rows_written += len(rows)
+            if self.rotate_rows is not None and self.file_rows >= self.rotate_rows:
+                self._finish_file()
+        self._flush_file()
+        self.last_flush = time.time()
+
+    def _finish_file(self):
+        self._close()
+        os.replace(self.current_path + '.part', self.current_path)
+        self.files.append(self.current_path)
+        self.current_path = None
+        self.file_rows = 0
+        self.file_index += 1
+
+    def close(self):
+        self.flush()
+        if self.current_path is None and not self.files:
+            # No rows at all: still leave a valid, empty output file
+            self.current_path = self._target_path()
+            self._open(self.current_path + '.part')
+        if self.current_path is not None:
+            self._finish_file()
+        return self.files
+
+    def abort(self):
+        # Drops the file being written; whatever was already under the
+        # final name (or finished by rotation) stays as it was
+        self.buffer = []
+        if self.current_path is not None:
+            self._close()
+            os.remove(self.current_path + '.part')
+            self.current_path = None
+        return self.files
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    # Back ends implement these
+    def _open(self, path):
+        raise NotImplementedError
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def _flush_file(self):
+        pass
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class CsvSink(RowSink):
+    def _open(self, path):
+        self.file = open(path, mode='w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def _write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def _flush_file(self):
+        if self.current_path is not None:
+            self.file.flush()
+
+    def _close(self):
+        self.file.close()
+
+
+class JsonlSink(RowSink):
+    def _open(self, path):
+        self.file = open(path, mode='w', encoding='utf-8')
+
+    def _write_rows(self, rows):
+        for row in rows:
+            self.file.write(json.dumps({key: row.get(key) for key in self.fieldnames}, ensure_ascii=False) + '\n')
+
+    def _flush_file(self):
+        if self.current_path is not None:
+            self.file.flush()
+
+    def _close(self):
+        self.file.close()
+
+
+class ParquetSink(RowSink):
+    # Every flush becomes one row group. Needs pyarrow.
+
+    def __init__(self, path, fieldnames, schema=None, **kwargs):
+        import pyarrow as pa
+        self.pa = pa
+        self.schema = schema or pa.schema([(name, pa.string()) for name in fieldnames])
+        super().__init__(path, fieldnames, **kwargs)
+
+    def _open(self, path):
+        import pyarrow.parquet as pq
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def _write_rows(self, rows):
+        columns = {name: [row.get(name) for row in rows] for name in self.fieldnames}
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def _close(self):
+        self.writer.close()
+
+
+SINKS = {
+    'csv': CsvSink,
+    'jsonl': JsonlSink,
+    'parquet': ParquetSink,
+}
+
+
+def open_sink(path, fieldnames, format=None, **kwargs):
+    # Picks the back end from `format` or the file extension
+    format = format or os.path.splitext(path)[1].lstrip('.').lower() or 'csv'
+    if format not in SINKS:
+        raise ValueError(f"Unknown sink format '{format}'. Choose from: {', '.join(SINKS)}")
+    return SINKS[format](path, fieldnames, **kwargs)
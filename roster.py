@@ -0,0 +1,280 @@
+import os
+import re
+import json
+import glob
+import hashlib
+import logging
+import zipfile
+import posixpath
+from collections import namedtuple
+from lxml import etree
+
+RosterEntry = namedtuple('RosterEntry', ['row', 'name', 'post', 'sex', 'department', 'status', 'hyperlink'])
+
+# Roster field -> accepted header names (case-insensitive), in order of preference
+REQUIRED_COLUMNS = {
+    'name': ['full name'],
+    'post': ['substantive post'],
+    'sex': ['sex'],
+    'department': ['department'],
+    'status': ['status', 'registered'],
+}
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+CELL_REF = re.compile(r'([A-Z]+)(\d+)')
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_columns(header, required_columns=REQUIRED_COLUMNS):
+    # field -> column index, for the fields whose header is present
+    header = [str(value).strip().lower() if value else '' for value in header]
+    columns = {}
+    for key, names in required_columns.items():
+        for name in names:
+            if name in header:
+                columns[key] = header.index(name)
+                break
+    return columns
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def _relationships(archive, path):
+    # Relationship id -> target path (or URL, for external targets)
+    if path not in archive.namelist():
+        return {}
+    base = posixpath.dirname(posixpath.dirname(path))
+    targets = {}
+    for rel in etree.fromstring(archive.read(path)).iter(f'{PACKAGE_REL_NS}Relationship'):
+        target = rel.get('Target')
+        if rel.get('TargetMode') != 'External':
+            target = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(base, target))
+        targets[rel.get('Id')] = target
+    return targets
+
+
+def _shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as file:
+        for _, item in etree.iterparse(file, tag=f'{MAIN_NS}si'):
+            strings.append(''.join(item.itertext()))
+            item.clear()
+    return strings
+
+
+def _number(value):
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _cell_value(cell, strings, typed=False):
+    # Cell text; `typed` gives values as openpyxl would: int/float/bool for
+    # numeric and boolean cells and '=formula' for a formula never calculated
+    kind = cell.get('t')
+    if kind == 'inlineStr':
+        return ''.join(cell.find(f'{MAIN_NS}is').itertext())
+    value = cell.findtext(f'{MAIN_NS}v')
+    if value is None:
+        formula = cell.findtext(f'{MAIN_NS}f')
+        return '=' + formula if typed and formula else None
+    if kind == 's':
+        return strings[int(value)]
+    if typed and kind in (None, 'n'):
+        return _number(value)
+    if typed and kind == 'b':
+        return value == '1'
+    return value
+
+
+def _read_sheet(archive, path, strings, typed=False):
+    # One streaming pass: (row number -> {column: value}) and the hyperlink
+    # target of every linked cell, keyed by (row number, column)
+    rows = {}
+    links = {}
+    relationships = _relationships(archive, posixpath.join(posixpath.dirname(path), '_rels',
+                                                           posixpath.basename(path) + '.rels'))
+    with archive.open(path) as file:
+        for _, element in etree.iterparse(file, tag=(f'{MAIN_NS}row', f'{MAIN_NS}hyperlink')):
+            if element.tag == f'{MAIN_NS}row':
+                values = {}
+                for cell in element.iter(f'{MAIN_NS}c'):
+                    match = CELL_REF.match(cell.get('r', ''))
+                    value = _cell_value(cell, strings, typed)
+                    if match and value is not None:
+                        values[_column_index(match.group(1))] = value
+                rows[int(element.get('r'))] = values
+            else:
+                target = relationships.get(element.get(f'{REL_NS}id'))
+                if target:
+                    start, _, end = element.get('ref').partition(':')
+                    first, last = CELL_REF.match(start), CELL_REF.match(end or start)
+                    for row in range(int(first.group(2)), int(last.group(2)) + 1):
+                        for column in range(_column_index(first.group(1)), _column_index(last.group(1)) + 1):
+                            links[(row, column)] = target
+            element.clear()
+    return rows, links
+
+
+def iter_sheets(excel_file, typed=False):
+    # (sheet name, {row number: {column: value}}, {(row number, column):
+    # hyperlink}) for every sheet, in workbook order, straight from the xlsx
+    # XML. Unlike openpyxl's read-only mode this also gets the hyperlinks,
+    # without loading the whole workbook. See _cell_value for `typed`.
+    with zipfile.ZipFile(excel_file) as archive:
+        strings = _shared_strings(archive)
+        sheet_paths = _relationships(archive, 'xl/_rels/workbook.xml.rels')
+        workbook = etree.fromstring(archive.read('xl/workbook.xml'))
+        for sheet in workbook.iter(f'{MAIN_NS}sheet'):
+            rows, links = _read_sheet(archive, sheet_paths[sheet.get(f'{REL_NS}id')], strings, typed)
+            yield sheet.get('name'), rows, links
+
+
+def sheet_entries(name, header, rows, link, required_columns=REQUIRED_COLUMNS):
+    # RosterEntry for every data row of one sheet. `header` lists the column
+    # titles, `rows` yields (row number, {column index: value}) and
+    # link(row number, column index) gives a cell's hyperlink.
+    columns = find_columns(header, required_columns)
+    missing = [key for key in ('name', 'status') if key not in columns]
+    if missing:
+        logging.warning(f"Sheet {name}: no column for {', '.join(missing)}, skipping it")
+        return []
+    entries = []
+    for row_number, values in rows:
+
+        def field(key):
+            index = columns.get(key)
+            value = values.get(index) if index is not None else None
+            return value.strip() if isinstance(value, str) else value
+
+        if field('name') is None and field('status') is None:
+            continue  # blank or numbering-only row
+        entries.append(RosterEntry(
+            row=row_number,
+            name=field('name'),
+            post=field('post'),
+            sex=field('sex'),
+            department=field('department') if 'department' in columns else 'N/A',
+            status=field('status'),
+            hyperlink=link(row_number, columns['status']),
+        ))
+    return entries
+
+
+def read_roster(excel_file, required_columns=REQUIRED_COLUMNS):
+    # {sheet name: [RosterEntry, ...]} for every sheet, in workbook order
+    roster = {}
+    for name, rows, links in iter_sheets(excel_file):
+        roster[name] = []
+        if not rows:
+            continue
+        header_row = min(rows)
+        header = rows[header_row]
+        roster[name] = sheet_entries(name, [header.get(index) for index in range(max(header, default=-1) + 1)],
+                                     ((row, rows[row]) for row in sorted(rows) if row != header_row),
+                                     lambda row, column: links.get((row, column)), required_columns)
+    return roster
+
+
+LINK_SUFFIX = ' hyperlink'  # CSV/Parquet shards keep a column's hyperlinks in '<column> hyperlink'
+
+
+def read_roster_shard(path, required_columns=REQUIRED_COLUMNS):
+    # Roster entries from one sheet split out by utils/sheet_splitter.py as
+    # CSV or Parquet; row numbers are the sheet's, header in row 1
+    import pandas as pd
+    if path.endswith('.parquet'):
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8')
+    frame = frame.astype(object).where(frame.notna() & (frame != ''), None)
+    header = list(frame.columns)
+    records = frame.to_dict('records')
+
+    def link(row, column):
+        return records[row - 2].get(header[column] + LINK_SUFFIX)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    rows = ((number, {index: record[column] for index, column in enumerate(header)})
+            for number, record in enumerate(records, start=2))
+    return sheet_entries(name, header, rows, link, required_columns)
+
+
+def load_roster_shards(folder):
+    # {sheet name: [RosterEntry, ...]} from a folder of split-out sheets,
+    # Parquet preferred over CSV when a sheet has both
+    shards = {}
+    for extension in ('.csv', '.parquet'):
+        for path in sorted(glob.glob(os.path.join(folder, '*' + extension))):
+            shards[os.path.splitext(os.path.basename(path))[0]] = path
+    return {name: read_roster_shard(path) for name, path in sorted(shards.items())}
+
+
+def _save_cache(roster, digest, cache_file):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = {'sheet': []}
+    columns.update({field: [] for field in RosterEntry._fields})
+    for sheet, entries in roster.items():
+        for entry in entries:
+            columns['sheet'].append(sheet)
+            for field, value in zip(RosterEntry._fields, entry):
+                columns[field].append(value)
+    table = pa.table(columns, schema=pa.schema([('sheet', pa.dictionary(pa.int16(), pa.string())),
+                                                ('row', pa.int32())] +
+                                               [(field, pa.string()) for field in RosterEntry._fields[1:]]))
+    metadata = {b'source_hash': digest.encode(), b'sheets': json.dumps(list(roster)).encode()}
+    pq.write_table(table.replace_schema_metadata(metadata), cache_file + '.part')
+    os.replace(cache_file + '.part', cache_file)
+
+
+def _load_cache(digest, cache_file):
+    import pyarrow.parquet as pq
+    if not os.path.exists(cache_file):
+        return None
+    metadata = pq.read_schema(cache_file).metadata or {}
+    if metadata.get(b'source_hash') != digest.encode():
+        return None
+    table = pq.read_table(cache_file).to_pydict()
+    roster = {sheet: [] for sheet in json.loads(metadata[b'sheets'])}
+    for index, sheet in enumerate(table['sheet']):
+        roster[sheet].append(RosterEntry(*(table[field][index] for field in RosterEntry._fields)))
+    return roster
+
+
+def load_roster(excel_file, cache_file=None):
+    # read_roster, cached next to the workbook in a Parquet file stamped with
+    # the workbook's hash; the workbook is only parsed again when it changes
+    cache_file = cache_file or os.path.splitext(excel_file)[0] + '.roster.parquet'
+    digest = file_hash(excel_file)
+    roster = _load_cache(digest, cache_file)
+    if roster is None:
+        roster = read_roster(excel_file)
+        _save_cache(roster, digest, cache_file)
+    return roster
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    excel_file = sys.argv[1] if len(sys.argv) > 1 else 'All UDSM Units.xlsx'
+    for attempt in ['first load', 'cached load']:
+        start_time = time.time()
+        roster = load_roster(excel_file)
+        print(f"{attempt}: {sum(len(entries) for entries in roster.values())} rows in {len(roster)} sheets "
+              f"in {time.time() - start_time:.3f}s")
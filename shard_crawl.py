@@ -0,0 +1,152 @@
+import os
+import glob
+import time
+import argparse
+import itertools
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from roster import load_roster, load_roster_shards
+from crawl_journal import CrawlJournal, merge_journals
+from college_crawl import CollegeCrawler, registered_profiles, METRICS_FILE
+from result_schema import FIELDNAMES
+from crawl_metrics import METRICS
+
+EXCEL_FILE = 'All UDSM Units.xlsx'
+OUTPUT_FOLDER = 'college_data'
+WORKERS = 4  # crawl processes, each with its own Tor instances, browsers and scraper
+
+Shard = namedtuple('Shard', ['worker', 'profiles'])  # profiles: [(college, hyperlink), ...]
+
+
+def plan_shards(colleges, workers, by='college'):
+    # Splits {college: [hyperlink, ...]} into at most `workers` shards. By
+    # college, whole colleges go to the least loaded worker, biggest first;
+    # by profile, every college's profiles are dealt out round robin, which
+    # balances better when one college dominates the roster.
+    if by == 'college':
+        loads = [[] for _ in range(workers)]
+        for college in sorted(colleges, key=lambda name: len(colleges[name]), reverse=True):
+            min(loads, key=len).extend((college, hyperlink) for hyperlink in colleges[college])
+    elif by == 'profile':
+        profiles = [(college, hyperlink) for college, hyperlinks in colleges.items() for hyperlink in hyperlinks]
+        loads = [profiles[index::workers] for index in range(workers)]
+    else:
+        raise ValueError(f"Unknown shard key {by!r}, expected 'college' or 'profile'")
+    return [Shard(worker, load) for worker, load in enumerate(loads) if load]
+
+
+def worker_journal(journal_file, worker):
+    root, ext = os.path.splitext(journal_file)
+    return f"{root}.worker{worker}{ext}"
+
+
+def worker_journals(journal_file):
+    root, ext = os.path.splitext(journal_file)
+    return sorted(glob.glob(f"{glob.escape(root)}.worker*{ext}"))
+
+
+def run_shard(shard, journal_file, crawler_options, metrics_file=METRICS_FILE):
+    # Worker process: crawls its profiles into its own journal. The main
+    # journal is only read, so work finished in earlier runs is skipped.
+    # Its metrics carry a worker label and go to their own file
+    # (crawl_metrics.worker<N>.prom).
+    METRICS.labels = {'worker': str(shard.worker)}
+    METRICS.start_export(worker_journal(metrics_file, shard.worker))
+    crawler = CollegeCrawler(worker_journal(journal_file, shard.worker), worker=shard.worker,
+                             journal_reads=[journal_file], **crawler_options)
+    start_time = time.time()
+    try:
+        for college, profiles in itertools.groupby(shard.profiles, key=lambda profile: profile[0]):
+            crawler.crawl_profiles(college, [hyperlink for _, hyperlink in profiles])
+    finally:
+        crawler.close()
+        METRICS.stop_export()
+    return dict(crawler.paper_dedupe.stats(), worker=shard.worker, profiles=len(shard.profiles),
+                seconds=round(time.time() - start_time, 1), papers_per_minute=METRICS.papers_per_minute())
+
+
+def crawl_sharded(roster, sheet_names, workers=WORKERS, by='college', journal_file='crawl_journal.jsonl',
+                  output_folder=OUTPUT_FOLDER, crawler_options=None):
+    # Runs the crawl of `sheet_names` in `workers` processes, then merges
+    # their journals into `journal_file` and rebuilds each college's
+    # research_papers_<college>.csv from it, as main_scholar co.py does
+    # one sheet at a time. Returns the worker stats and whether every sheet
+    # is now complete.
+    crawler_options = crawler_options or {}
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Worker journals left by an interrupted run hold finished work too
+    leftovers = worker_journals(journal_file)
+    if leftovers:
+        print(f"Merged {merge_journals(journal_file, leftovers)} entries left by an earlier run")
+
+    journal = CrawlJournal(journal_file)
+    colleges = {}
+    for sheet_name in sheet_names:
+        if journal.is_college_done(sheet_name):
+            print(f"Skipping sheet {sheet_name}: already complete in the journal")
+            continue
+        colleges[sheet_name] = registered_profiles(roster[sheet_name], verbose=False)
+    pending = {college: [hyperlink for hyperlink in hyperlinks if not journal.is_profile_done(college, hyperlink[5])]
+               for college, hyperlinks in colleges.items()}
+    journal.close()
+    shards = plan_shards({college: hyperlinks for college, hyperlinks in pending.items() if hyperlinks},
+                         workers, by)
+    print(f"{sum(len(shard.profiles) for shard in shards)} profiles in {len(colleges)} colleges, "
+          f"split over {len(shards)} workers by {by}")
+
+    stats = []
+    start_time = time.time()
+    if shards:
+        # spawn everywhere: each worker starts its own Tor, browsers and SQLite connections from scratch
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as executor:
+            futures = {executor.submit(run_shard, shard, journal_file, crawler_options): shard for shard in shards}
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    stats.append(future.result())
+                    print(f"Worker {shard.worker} finished: {stats[-1]}")
+                except Exception as e:
+                    # Whatever it journaled before failing is still merged below
+                    print(f"Worker {shard.worker} failed: {e}")
+
+    merge_journals(journal_file, worker_journals(journal_file))
+    journal = CrawlJournal(journal_file)
+    for college, hyperlinks in colleges.items():
+        csv_file = os.path.join(output_folder, f"research_papers_{college}.csv")
+        row_count = journal.rebuild_output(college, csv_file, FIELDNAMES)
+        if all(journal.is_profile_done(college, hyperlink[5]) for hyperlink in hyperlinks):
+            journal.mark_college_done(college)
+        print(f"Research paper details for {college} saved to {csv_file} ({row_count} papers)")
+    complete = all(journal.is_college_done(name) for name in sheet_names)
+    journal.close()
+    print(f"Crawled {len(colleges)} colleges with {len(shards)} workers in {time.time() - start_time:.0f}s")
+    return stats, complete
+
+
+if __name__ == "__main__":
+    # python shard_crawl.py --workers 4 --by profile [--cache-only] [--incremental]
+    parser = argparse.ArgumentParser(description="Crawl the roster's college sheets in parallel processes")
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--by', choices=['college', 'profile'], default='college')
+    parser.add_argument('--cache-only', action='store_true', help="answer everything from the page cache")
+    parser.add_argument('--incremental', action='store_true', help="only fetch papers not seen before")
+    parser.add_argument('--roster', default=EXCEL_FILE,
+                        help="the roster workbook, or a folder of CSV/Parquet sheets from utils/sheet_splitter.py")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.roster):
+        roster = load_roster_shards(args.roster)
+        sheet_names = list(roster)
+    else:
+        roster = load_roster(args.roster)
+        sheet_names = list(roster)[1:]  # Exclude the first sheet
+    # Refresh runs keep their own journal, cleared once the refresh completes
+    journal_file = 'crawl_journal_incremental.jsonl' if args.incremental else 'crawl_journal.jsonl'
+    stats, complete = crawl_sharded(roster, sheet_names, args.workers, args.by, journal_file,
+                                    crawler_options={'cache_only': args.cache_only, 'incremental': args.incremental})
+    if args.incremental and complete:
+        os.remove(journal_file)  # the next refresh starts from scratch
+    print("Processing complete.")
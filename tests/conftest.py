@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# The modules live at the top of the repo, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_scholar  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def server():
+    # The fixture pages served locally; no Tor and no Google
+    server = mock_scholar.start_server()
+    yield server
+    server.shutdown()
@@ -0,0 +1,96 @@
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import mock_scholar
+from fetch_engines import HttpEngine, block_reason, empty_details
+from profile_lister import ProfileLister
+
+EXPECTED_DETAILS = {
+    'u5HHmVD_uO8C': {'authors': 'Mwakalinga B., Greyson K. A., Abdalla A. T.',
+                     'journal': 'Tanzania Journal of Engineering and Technology', 'volume': '43',
+                     'pages': '112-125', 'organization': 'University of Dar es Salaam'},
+    'd1gkVwhDpl0C': {'authors': 'Abdalla A. T., Maiseli B.', 'pages': '1-6', 'booktitle': '2021 IEEE AFRICON',
+                     'organization': 'IEEE'},
+    'Y0pCki6q_DkC': {'authors': 'Anatory J.', 'journal': 'Telecommunication Networks', 'pages': '1-240',
+                     'organization': 'Springer'},
+    '9yKSN-GCB0IC': {'authors': 'Greyson K. A.'},
+    'qjMakFHDy7sC': {},
+}
+
+
+@pytest.fixture
+def engine():
+    engine = HttpEngine()
+    yield engine
+    engine.close()
+
+
+def test_every_fixture_has_expected_details():
+    assert sorted(mock_scholar.citation_fixtures()) == sorted(EXPECTED_DETAILS)
+
+
+@pytest.mark.parametrize('paper_id', sorted(EXPECTED_DETAILS))
+def test_citation_page_details(server, engine, paper_id):
+    details = engine.scrape_paper_details(mock_scholar.citation_url(server, paper_id))
+    # Fields the page does not have come back as 'N/A'
+    assert details == dict(empty_details(), **EXPECTED_DETAILS[paper_id])
+    assert not engine.is_detected()
+
+
+def test_js_only_page_needs_browser(server, engine):
+    engine.scrape_paper_details(mock_scholar.citation_url(server, 'qjMakFHDy7sC'))
+    assert engine.needs_browser()
+
+
+@pytest.mark.parametrize('paper_id', ['u5HHmVD_uO8C', '9yKSN-GCB0IC'])
+def test_rendered_page_does_not_need_browser(server, engine, paper_id):
+    engine.scrape_paper_details(mock_scholar.citation_url(server, paper_id))
+    assert not engine.needs_browser()
+
+
+class BlankPageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.end_headers()
+        self.wfile.write(b'  \n ')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_blank_page_is_detected_not_a_parse_error(engine):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BlankPageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        host, port = server.server_address[:2]
+        details = engine.scrape_paper_details(f'http://{host}:{port}/citations?view_op=view_citation')
+    finally:
+        server.shutdown()
+    assert details == empty_details()
+    assert engine.is_detected()
+    assert engine.blocked == 'empty page'
+
+
+def test_profile_listing(server):
+    lister = ProfileLister(parallel=2)
+    try:
+        listing = lister.list_profile(mock_scholar.profile_url(server))
+    finally:
+        lister.close()
+    assert len(listing.rows) == 130
+    assert len({row.link for row in listing.rows}) == 130
+    assert listing.metrics == {'citations': '1874', 'h_index': '21', 'i10_index': '38'}
+
+
+@pytest.mark.parametrize('status, url, content, reason', [
+    (200, 'https://scholar.google.com/citations', b'<html>' + b'x' * 100 + b'</html>', None),
+    (302, 'https://www.google.com/sorry/index?continue=x', None, 'sorry redirect'),
+    (429, 'https://scholar.google.com/citations', b'', 'HTTP 429'),
+    (200, 'https://scholar.google.com/citations', b'<form id="gs_captcha_f">' + b'x' * 100, 'captcha'),
+    (200, 'https://scholar.google.com/citations', b'Our systems have detected unusual traffic' + b'x' * 100,
+     'unusual traffic'),
+    (200, 'https://scholar.google.com/citations', b'  ', 'empty page'),
+])
+def test_block_reason(status, url, content, reason):
+    assert block_reason(status, url, content) == reason
@@ -0,0 +1,118 @@
+import time
+import threading
+import pytest
+from mock_scholar import FakeTorInstance
+from tor_proxy import TorPool
+
+
+class RenewalTracker:
+    # Launcher whose instances record how many renew at the same time
+    def __init__(self, renew_delay=0):
+        self.renew_delay = renew_delay
+        self.lock = threading.Lock()
+        self.renewing = 0
+        self.most_renewing = 0
+        self.instances = []
+
+    def __call__(self, socks_port, control_port):
+        tracker = self
+
+        class Instance(FakeTorInstance):
+            def renew_connection(self):
+                with tracker.lock:
+                    tracker.renewing += 1
+                    tracker.most_renewing = max(tracker.most_renewing, tracker.renewing)
+                try:
+                    super().renew_connection()
+                finally:
+                    with tracker.lock:
+                        tracker.renewing -= 1
+
+        instance = Instance(self.renew_delay)
+        self.instances.append(instance)
+        return instance
+
+
+def start_pool(**options):
+    options.setdefault('launcher', lambda socks_port, control_port: FakeTorInstance())
+    pool = TorPool(**options)
+    pool.start()
+    return pool
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_acquire_picks_least_busy_circuit():
+    pool = start_pool(size=3, per_circuit=2, rotate_after=100)
+    try:
+        first = [pool.acquire() for _ in range(3)]
+        assert sorted(circuit.index for circuit in first) == [0, 1, 2]
+        second = [pool.acquire() for _ in range(3)]
+        assert all(circuit.active == 2 for circuit in pool.circuits)
+        with pytest.raises(TimeoutError):
+            pool.acquire(timeout=0.05)
+        pool.release(second[1])
+        assert pool.acquire(timeout=1) is second[1]
+    finally:
+        pool.stop()
+
+
+def test_circuit_rotates_after_rotate_after_requests():
+    pool = start_pool(size=1, rotate_after=3)
+    try:
+        circuit = pool.circuits[0]
+        for _ in range(2):
+            pool.release(pool.acquire())
+        assert circuit.proxy.renewals == 0
+        pool.release(pool.acquire())
+        wait_for(lambda: circuit.renewals == 1)
+        assert circuit.proxy.renewals == 1
+        assert circuit.requests == 0
+        assert circuit.total_requests == 3
+    finally:
+        pool.stop()
+
+
+def test_one_renewal_at_a_time():
+    tracker = RenewalTracker(renew_delay=0.1)
+    pool = start_pool(size=3, rotate_after=1, launcher=tracker)
+    try:
+        circuits = [pool.acquire() for _ in range(3)]
+        for circuit in circuits:
+            pool.release(circuit)
+        wait_for(lambda: all(circuit.renewals == 1 for circuit in circuits))
+        assert tracker.most_renewing == 1
+        assert [instance.renewals for instance in tracker.instances] == [1, 1, 1]
+    finally:
+        pool.stop()
+
+
+def test_ban_quarantines_with_doubling_cooldown():
+    pool = start_pool(size=1, cooldown=0.2, max_cooldown=0.5)
+    try:
+        circuit = pool.circuits[0]
+        cooldowns = []
+        for _ in range(3):
+            pool.release(pool.acquire(timeout=2), banned=True)
+            cooldowns.append(circuit.quarantined_until - time.time())
+            assert circuit.banned
+            # Quarantined: nothing to hand out even once the renewal is done
+            wait_for(lambda: circuit.renewals == len(cooldowns))
+            with pytest.raises(TimeoutError):
+                pool.acquire(timeout=0.05)
+        assert cooldowns[0] == pytest.approx(0.2, abs=0.05)
+        assert cooldowns[1] == pytest.approx(0.4, abs=0.05)
+        assert cooldowns[2] == pytest.approx(0.5, abs=0.05)  # capped at max_cooldown
+        assert circuit.bans == 3
+
+        # A clean page resets the strikes: the next ban starts over at `cooldown`
+        pool.release(pool.acquire(timeout=2))
+        pool.release(pool.acquire(timeout=2), banned=True)
+        assert circuit.quarantined_until - time.time() == pytest.approx(0.2, abs=0.05)
+    finally:
+        pool.stop()
@@ -1,12 +1,27 @@
 import os
 import time
+import queue
+import logging
+import threading
 import stem.process
 import re
-import requests
-import json
+from collections import namedtuple
 from datetime import datetime
-from stem import Signal
-from stem.control import Controller
+from stem import Signal, CircStatus, CircPurpose, CircBuildFlag, StreamStatus
+from stem.control import Controller, EventType
+from crawl_metrics import METRICS
+
+CIRCUIT_TIMEOUT = 30  # seconds to wait for Tor to build a fresh circuit after NEWNYM
+
+ExitRelay = namedtuple('ExitRelay', ['circuit', 'fingerprint', 'nickname', 'address', 'country'])
+
+
+def exit_circuit(circuit):
+    # General-purpose circuits that can carry our traffic out, not internal or one-hop ones
+    flags = circuit.build_flags or []
+    return (circuit.purpose == CircPurpose.GENERAL and CircBuildFlag.IS_INTERNAL not in flags
+            and CircBuildFlag.ONEHOP_TUNNEL not in flags)
+
 
 class TorProxy:
     def __init__(self, socks_port=9055, control_port=9051, password=None):
@@ -15,6 +30,8 @@ class TorProxy:
         self.password = password
         self.tor_path = r"Tor\tor\tor.exe"
         self.tor_process = None
+        self.controller = None
+        self.stream_circuit = None  # circuit the latest stream went out on
         self.proxies = {
             'http': f'socks5://127.0.0.1:{self.socks_port}',
             'https': f'socks5://127.0.0.1:{self.socks_port}'
@@ -25,6 +42,8 @@ class TorProxy:
             config={
                 'SocksPort': str(self.socks_port),
                 'ControlPort': str(self.control_port),
+                # Each instance needs its own data directory to run next to the others
+                'DataDirectory': os.path.abspath(os.path.join('tor_data', str(self.socks_port))),
                 'CookieAuthentication': '1',
                 'MaxCircuitDirtiness': '5',
                 'GeoIPFile': 'https://raw.githubusercontent.com/torproject/tor/main/src/config/geoip',
@@ -32,34 +51,236 @@ class TorProxy:
             init_msg_handler=lambda line: print(line) if re.search('Bootstrapped', line) else False,
             tor_cmd=self.tor_path
         )
+        self.connect()
         print("TOR proxy started.")
 
+    def connect(self):
+        # One control connection for the life of the instance: it follows
+        # the circuits our streams use, and stem tracks Tor's NEWNYM rate
+        # limit on it
+        controller = Controller.from_port(port=self.control_port)
+        if self.password:
+            controller.authenticate(password=self.password)
+        else:
+            controller.authenticate()
+        controller.add_event_listener(self._on_stream, EventType.STREAM)
+        self.controller = controller
+        return controller
+
+    def _on_stream(self, event):
+        if event.status == StreamStatus.SUCCEEDED and event.circ_id:
+            self.stream_circuit = event.circ_id
+
     def stop(self):
+        if self.controller is not None:
+            self.controller.close()
+            self.controller = None
         if self.tor_process:
             self.tor_process.kill()
             print("TOR proxy stopped.")
 
-    def renew_connection(self):
-        with Controller.from_port(port=self.control_port) as controller:
-            if self.password:
-                controller.authenticate(password=self.password)
-            else:
-                controller.authenticate()
-            controller.signal(Signal.NEWNYM)
-            time.sleep(5)
-            ip_address = self.get_ip()
-            print(f"New Tor connection established {ip_address}.")
+    def renew_connection(self, timeout=CIRCUIT_TIMEOUT):
+        # NEWNYM, then wait for Tor to report a circuit built after it
+        # (a CIRC BUILT event) instead of sleeping a fixed time. Tor ignores
+        # a NEWNYM sent within 10s of the last one, so an early renewal waits
+        # out the rest of that first. Returns the new circuit's ExitRelay,
+        # or None if no circuit was built within `timeout` seconds (Tor then
+        # builds one for the next request).
+        METRICS.count('renewals')
+        with METRICS.timer('tor_renewal'):
+            controller = self.controller or self.connect()
+            METRICS.sleep(controller.get_newnym_wait())
+            dirty = {circuit.id for circuit in controller.get_circuits()}
+            built = queue.Queue()
+
+            def on_circuit(event):
+                if event.status == CircStatus.BUILT and event.id not in dirty and exit_circuit(event):
+                    built.put(event)
+
+            controller.add_event_listener(on_circuit, EventType.CIRC)
+            try:
+                controller.signal(Signal.NEWNYM)
+                circuit = built.get(timeout=timeout)
+            except queue.Empty:
+                logging.warning(f"Tor on port {self.socks_port} built no new circuit within {timeout}s of NEWNYM")
+                return None
+            finally:
+                controller.remove_event_listener(on_circuit)
+        relay = self.exit_relay(circuit)
+        print(f"New Tor connection established {self.describe(relay)}.")
+        return relay
+
+    def exit_relay(self, circuit=None):
+        # Exit of `circuit`, by default the one our latest stream used (or
+        # the newest built circuit), looked up in Tor's own consensus
+        controller = self.controller or self.connect()
+        if circuit is None and self.stream_circuit:
+            circuit = controller.get_circuit(self.stream_circuit, None)
+        if circuit is None:
+            built = [c for c in controller.get_circuits() if c.status == CircStatus.BUILT and exit_circuit(c)]
+            circuit = built[-1] if built else None
+        if circuit is None or not circuit.path:
+            return None
+        fingerprint, nickname = circuit.path[-1]
+        status = controller.get_network_status(fingerprint, None)
+        address = status.address if status else None
+        country = controller.get_info(f'ip-to-country/{address}', None) if address else None
+        return ExitRelay(circuit.id, fingerprint, nickname, address, country)
+
+    def describe(self, relay):
+        if relay is None:
+            return "(no circuit built yet)"
+        return (f'TOR IP [{datetime.now().strftime("%d-%m-%Y %H:%M:%S")}]: {relay.address} '
+                f'{relay.country or "??"} via {relay.nickname} (circuit {relay.circuit})')
 
     def get_ip(self):
+        # The exit address as Tor reports it, no request to an outside service
         try:
-            
-            response = requests.get("https://ipinfo.io/json", proxies=self.proxies)
-            result = json.loads(response.content)
-            return f'TOR IP [{datetime.now().strftime("%d-%m-%Y %H:%M:%S")}]: {result["ip"]} {result["country"]}'
-        
-        #OR check on http://check.torproject.org
-        
+            return self.describe(self.exit_relay())
         except Exception as e:
             return f"Failed to retrieve IP information: {e}"
 
-            
\ No newline at end of file
+
+def launch_tor(socks_port, control_port):
+    proxy = TorProxy(socks_port=socks_port, control_port=control_port)
+    proxy.start()
+    return proxy
+
+
+class Circuit:
+    def __init__(self, index, proxy):
+        self.index = index
+        self.proxy = proxy
+        self.proxies = proxy.proxies
+        self.active = 0
+        self.requests = 0
+        self.total_requests = 0
+        self.renewals = 0
+        self.bans = 0
+        self.strikes = 0  # bans since the circuit last served a clean page
+        self.banned = False
+        self.renewing = False
+        self.quarantined_until = 0.0
+
+    def available(self, per_circuit, now):
+        return (not self.banned and not self.renewing and now >= self.quarantined_until
+                and self.active < per_circuit)
+
+    def __repr__(self):
+        return (f"Circuit({self.index}, active={self.active}, requests={self.requests}, "
+                f"bans={self.bans}, banned={self.banned}, renewing={self.renewing})")
+
+
+class TorPool:
+    # Runs `size` tor instances on consecutive Socks/Control ports and hands
+    # their circuits out to workers. A circuit is rotated (NEWNYM) in the
+    # background after `rotate_after` requests or when a worker reports it
+    # banned; the other instances keep serving while it renews.
+    # A banned circuit is also quarantined for `cooldown` seconds, doubled
+    # for every further ban before it serves a clean page again (at most
+    # `max_cooldown`), so a burned exit range is left alone for a while.
+    # `launcher(socks_port, control_port)` must return an object with
+    # `proxies`, `renew_connection()` and `stop()`, like TorProxy.
+    def __init__(self, size=3, base_socks_port=9060, base_control_port=9160,
+                 per_circuit=2, rotate_after=50, launcher=launch_tor, cooldown=30, max_cooldown=600):
+        self.size = size
+        self.base_socks_port = base_socks_port
+        self.base_control_port = base_control_port
+        self.per_circuit = per_circuit
+        self.rotate_after = rotate_after
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.launcher = launcher
+        self.circuits = []
+        self.condition = threading.Condition()
+        self.rotation_queue = []
+        self.renewal_threads = []
+
+    def start(self):
+        for i in range(self.size):
+            proxy = self.launcher(self.base_socks_port + i, self.base_control_port + i)
+            self.circuits.append(Circuit(i, proxy))
+        print(f"TOR pool started with {self.size} instances.")
+
+    def stop(self):
+        with self.condition:
+            self.rotation_queue = []
+        for thread in list(self.renewal_threads):
+            thread.join()
+        for circuit in self.circuits:
+            circuit.proxy.stop()
+        self.circuits = []
+
+    def acquire(self, timeout=None):
+        # Least busy healthy circuit; blocks while every circuit is full,
+        # banned, renewing or quarantined.
+        with self.condition:
+            deadline = None if timeout is None else time.time() + timeout
+            while True:
+                now = time.time()
+                candidates = [c for c in self.circuits if c.available(self.per_circuit, now)]
+                if candidates:
+                    circuit = min(candidates, key=lambda c: (c.active, c.requests))
+                    circuit.active += 1
+                    circuit.requests += 1
+                    circuit.total_requests += 1
+                    return circuit
+                # Nothing signals the end of a quarantine: wake up for it
+                waits = [c.quarantined_until - now for c in self.circuits if c.quarantined_until > now]
+                if deadline is not None:
+                    waits.append(deadline - now)
+                    if deadline <= now:
+                        raise TimeoutError("No Tor circuit available")
+                self.condition.wait(min(waits) if waits else None)
+
+    def release(self, circuit, banned=False):
+        with self.condition:
+            circuit.active -= 1
+            if banned and not circuit.banned:
+                circuit.banned = True
+                circuit.bans += 1
+                circuit.strikes += 1
+                cooldown = min(self.max_cooldown, self.cooldown * 2 ** (circuit.strikes - 1))
+                circuit.quarantined_until = time.time() + cooldown
+                print(f"Circuit {circuit.index} blocked, quarantined for {cooldown:.0f}s")
+            elif not banned and not circuit.banned:
+                circuit.strikes = 0
+            if circuit.banned or circuit.requests >= self.rotate_after:
+                self._schedule_rotation(circuit)
+            self.condition.notify_all()
+
+    def _schedule_rotation(self, circuit):
+        # Only one instance renews at a time so the rest keep serving. A
+        # circuit waiting its turn keeps serving unless it is banned.
+        if circuit not in self.rotation_queue and not circuit.renewing:
+            self.rotation_queue.append(circuit)
+        if self.rotation_queue and not any(c.renewing for c in self.circuits):
+            next_circuit = self.rotation_queue.pop(0)
+            next_circuit.renewing = True
+            thread = threading.Thread(target=self._rotate, args=(next_circuit,), daemon=True)
+            self.renewal_threads = [t for t in self.renewal_threads if t.is_alive()] + [thread]
+            thread.start()
+
+    def _rotate(self, circuit):
+        try:
+            circuit.proxy.renew_connection()
+        except Exception as e:
+            print(f"Failed to renew circuit {circuit.index}: {e}")
+        with self.condition:
+            circuit.requests = 0
+            circuit.renewals += 1
+            circuit.banned = False
+            circuit.renewing = False
+            if self.rotation_queue:
+                self._schedule_rotation(self.rotation_queue[0])
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return [
+                {'circuit': c.index, 'socks_port': self.base_socks_port + c.index,
+                 'requests': c.total_requests, 'renewals': c.renewals, 'bans': c.bans,
+                 'banned': c.banned, 'renewing': c.renewing,
+                 'quarantined': round(max(0.0, c.quarantined_until - time.time()), 1)}
+                for c in self.circuits
+            ]
@@ -1,31 +1,144 @@
 import os
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from roster import iter_sheets, LINK_SUFFIX
+
 # Set the input file path and output folder
-input_file = r"C:\Users\User\Downloads\All UDSM Units.xlsx"
-output_folder = "colleges"
-
-# Create the output folder if it doesn't exist
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
-
-# Read the Excel file
-excel_file = pd.ExcelFile(input_file)
-
-# Get all sheet names
-sheet_names = excel_file.sheet_names
-
-# Iterate through sheets, skipping the first one
-for sheet_name in sheet_names[1:]:
-    # Read the sheet
-    df = pd.read_excel(input_file, sheet_name=sheet_name)
-    
-    # Create the output file path
-    output_file = os.path.join(output_folder, f"{sheet_name}.xlsx")
-    
-    # Save the sheet as a new Excel file
-    df.to_excel(output_file, index=False)
-    
-    print(f"Saved {sheet_name} to {output_file}")
-
-print("All sheets have been saved as separate files.")
\ No newline at end of file
+INPUT_FILE = r"C:\Users\User\Downloads\All UDSM Units.xlsx"
+OUTPUT_FOLDER = "colleges"
+STATE_FILE = '.split_state.json'  # in the output folder: content hash behind each written file
+FORMATS = ['xlsx', 'csv', 'parquet']
+
+
+def column_names(header, width):
+    # Header titles as pandas names them: 'Unnamed: <i>' for blanks, '.1' on repeats
+    names = []
+    for index in range(width):
+        value = header.get(index)
+        name = str(value).strip() if value is not None and str(value).strip() else f"Unnamed: {index}"
+        base, repeat = name, 0
+        while name in names:
+            repeat += 1
+            name = f"{base}.{repeat}"
+        names.append(name)
+    return names
+
+
+def sheet_frame(rows, links):
+    # One parsed sheet -> (DataFrame of its data rows, {column: [hyperlink per row]})
+    if not rows:
+        return pd.DataFrame(), {}
+    header_row = min(rows)
+    width = max((max(values) + 1 for values in rows.values() if values), default=0)
+    columns = column_names(rows[header_row], width)
+    row_numbers = list(range(header_row + 1, max(rows) + 1))
+    while row_numbers and not rows.get(row_numbers[-1]):
+        row_numbers.pop()  # trailing blank rows
+    frame = pd.DataFrame([[rows.get(number, {}).get(index) for index in range(width)] for number in row_numbers],
+                         columns=columns)
+    hyperlinks = {}
+    for index, name in enumerate(columns):
+        column_links = [links.get((number, index)) for number in row_numbers]
+        if any(column_links):
+            hyperlinks[name] = column_links
+    return frame, hyperlinks
+
+
+def content_hash(frame, hyperlinks):
+    digest = hashlib.sha256(json.dumps([list(frame.columns), sorted(hyperlinks.items())]).encode())
+    digest.update(pd.util.hash_pandas_object(frame.astype(str), index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def write_sheet(frame, hyperlinks, output_file):
+    # xlsx keeps the sheet's values as they were; CSV and Parquet shards are
+    # all text plus a '<column> hyperlink' column per linked column, which
+    # roster.load_roster_shards reads without parsing any Excel
+    root, extension = os.path.splitext(output_file)
+    part_file = f"{root}.part{extension}"  # pandas picks the writer by extension
+    if output_file.endswith('.xlsx'):
+        frame.to_excel(part_file, index=False, engine='openpyxl')
+    else:
+        shard = frame.astype(object).where(frame.notna(), None).map(lambda value: None if value is None else str(value))
+        for name, column_links in hyperlinks.items():
+            shard[name + LINK_SUFFIX] = column_links
+        if output_file.endswith('.parquet'):
+            shard.to_parquet(part_file, index=False)
+        else:
+            shard.to_csv(part_file, index=False, encoding='utf-8')
+    os.replace(part_file, output_file)
+    return output_file
+
+
+def _load_state(output_folder):
+    try:
+        with open(os.path.join(output_folder, STATE_FILE), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(output_folder, state):
+    path = os.path.join(output_folder, STATE_FILE)
+    with open(path + '.part', 'w', encoding='utf-8') as file:
+        json.dump(state, file, indent=1, ensure_ascii=False)
+    os.replace(path + '.part', path)
+
+
+def split_workbook(input_file=INPUT_FILE, output_folder=OUTPUT_FOLDER, formats=('xlsx',), workers=None,
+                   force=False):
+    # Parses the workbook once, then writes every sheet but the first as
+    # <sheet>.<format> in parallel processes. A file whose sheet content
+    # hash matches the one it was written from is left alone.
+    os.makedirs(output_folder, exist_ok=True)
+    state = _load_state(output_folder)
+    jobs = []
+    skipped = 0
+    for index, (sheet_name, rows, links) in enumerate(iter_sheets(input_file, typed=True)):
+        if index == 0:
+            continue  # the summary sheet
+        frame, hyperlinks = sheet_frame(rows, links)
+        digest = content_hash(frame, hyperlinks)
+        for extension in formats:
+            output_file = os.path.join(output_folder, f"{sheet_name}.{extension}")
+            if not force and state.get(os.path.basename(output_file)) == digest and os.path.exists(output_file):
+                skipped += 1
+                continue
+            jobs.append((frame, hyperlinks, output_file, digest))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(jobs))) as executor:
+            futures = [(executor.submit(write_sheet, frame, hyperlinks, output_file), output_file, digest)
+                       for frame, hyperlinks, output_file, digest in jobs]
+            for future, output_file, digest in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Failed to write {output_file}: {e}")
+                    continue
+                state[os.path.basename(output_file)] = digest
+                print(f"Saved {output_file}")
+    _save_state(output_folder, state)
+    print(f"{len(jobs)} files written, {skipped} unchanged")
+    return [output_file for _, _, output_file, _ in jobs]
+
+
+if __name__ == "__main__":
+    # python utils/sheet_splitter.py [workbook] --format xlsx --format parquet
+    parser = argparse.ArgumentParser(description="Split the roster workbook into one file per sheet")
+    parser.add_argument('input_file', nargs='?', default=INPUT_FILE)
+    parser.add_argument('--output-folder', default=OUTPUT_FOLDER)
+    parser.add_argument('--format', dest='formats', action='append', choices=FORMATS,
+                        help="xlsx (default), csv or parquet; repeat for several")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help="rewrite files even if their sheet is unchanged")
+    args = parser.parse_args()
+
+    split_workbook(args.input_file, args.output_folder, args.formats or ['xlsx'], args.workers, args.force)
+    print("All sheets have been saved as separate files.")